@@ -4,20 +4,36 @@ Generates Brilliant-style interactive lessons from Knowledge Units.
 """
 from __future__ import annotations
 
-import argparse
-import json
+import functools
+import hashlib
 import os
-from dataclasses import dataclass
+import secrets
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
-from uuid import uuid4
-
-from backend.models import write_json_atomic
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+from backend.models import (
+    extract_json_object,
+    file_mtime_ns,
+    filter_dicts,
+    json_document_chunks,
+    read_json_cached,
+    write_json_atomic,
+    write_json_chunks_atomic,
+    write_json_stdout,
+)
+from backend.paths import resolve_data_dir
+
+if TYPE_CHECKING:
+    import asyncio
 
 LESSON_STORE_FILE = "lesson-plans.json"
+LESSON_CACHE_FILE = "lesson-cache.json"
 UNIT_STORE_FILE = "knowledge-units.json"
 DEFAULT_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-pro")
+MAX_CONCURRENT_GENERATIONS = 8
+LESSON_CACHE_MAX_ENTRIES = 512
 
 
 @dataclass(frozen=True)
@@ -25,28 +41,7 @@ class LessonPayload:
     lessons: List[dict]
     source: Optional[str]
     last_updated: Optional[str]
-
-
-def _default_data_dir() -> Optional[Path]:
-    if "CAT_DATA_DIR" in os.environ:
-        return Path(os.environ["CAT_DATA_DIR"])
-
-    if "LOCALAPPDATA" in os.environ:
-        return Path(os.environ["LOCALAPPDATA"]) / "CatAdaptive" / "data"
-
-    home_dir = Path.home()
-    if home_dir.exists():
-        return home_dir / ".local" / "share" / "CatAdaptive" / "data"
-
-    return None
-
-
-def _resolve_data_dir(data_dir: Optional[Path]) -> Optional[Path]:
-    target_dir = data_dir or _default_data_dir()
-    if target_dir is None:
-        return None
-    target_dir.mkdir(parents=True, exist_ok=True)
-    return target_dir
+    by_unit_id: Dict[str, dict] = field(default_factory=dict)
 
 
 def _resolve_units_path(data_dir: Path) -> Path:
@@ -61,13 +56,10 @@ def _load_units(data_dir: Path) -> List[dict]:
     path = _resolve_units_path(data_dir)
     if not path.exists():
         return []
-    payload = json.loads(path.read_text(encoding="utf-8"))
+    payload = read_json_cached(path)
     if isinstance(payload, dict):
-        units = payload.get("units", [])
-        return [unit for unit in units if isinstance(unit, dict)]
-    if isinstance(payload, list):
-        return [unit for unit in payload if isinstance(unit, dict)]
-    return []
+        return filter_dicts(payload.get("units"))
+    return filter_dicts(payload)
 
 
 def _load_lessons(data_dir: Path) -> LessonPayload:
@@ -75,45 +67,96 @@ def _load_lessons(data_dir: Path) -> LessonPayload:
     if not lesson_path.exists():
         return LessonPayload([], None, None)
 
-    payload = json.loads(lesson_path.read_text(encoding="utf-8"))
-    lessons = payload.get("lessons") if isinstance(payload, dict) else []
-    if not isinstance(lessons, list):
-        lessons = []
+    payload = read_json_cached(lesson_path)
+    raw_lessons = payload.get("lessons") if isinstance(payload, dict) else []
+    if not isinstance(raw_lessons, list):
+        raw_lessons = []
+
+    lessons: List[dict] = []
+    by_unit_id: Dict[str, dict] = {}
+    for lesson in raw_lessons:
+        if not isinstance(lesson, dict):
+            continue
+        lessons.append(lesson)
+        source_unit_id = lesson.get("sourceUnitId")
+        if source_unit_id:
+            by_unit_id[source_unit_id] = lesson
+
+    return _lesson_payload(lesson_path, lessons, by_unit_id)
+
 
+def _lesson_payload(lesson_path: Path, lessons: List[dict], by_unit_id: Dict[str, dict]) -> LessonPayload:
     updated_at = datetime.fromtimestamp(lesson_path.stat().st_mtime, tz=timezone.utc).isoformat()
     return LessonPayload(
-        lessons=[lesson for lesson in lessons if isinstance(lesson, dict)],
+        lessons=lessons,
         source=str(lesson_path),
         last_updated=updated_at,
+        by_unit_id=by_unit_id,
     )
 
 
-def _save_lessons(data_dir: Path, lessons: List[dict]) -> None:
-    payload = {
-        "lessons": lessons,
-        "updatedAt": datetime.now(tz=timezone.utc).isoformat(),
-    }
-    write_json_atomic(_resolve_lessons_path(data_dir), payload)
+def _save_lessons(data_dir: Path, lessons: List[dict], updated_at: str) -> None:
+    chunks = json_document_chunks(
+        "lessons",
+        lessons,
+        updatedAt=updated_at,
+    )
+    write_json_chunks_atomic(_resolve_lessons_path(data_dir), chunks, fsync=False)
 
 
-def _extract_json_from_text(text: str) -> Optional[dict]:
-    if not text:
-        return None
-    text = text.strip()
-    if text.startswith("{") and text.endswith("}"):
-        try:
-            return json.loads(text)
-        except json.JSONDecodeError:
-            return None
-
-    end_index = text.rfind("}")
-    start_index = text.find("{")
-    if start_index == -1 or end_index == -1 or end_index <= start_index:
-        return None
-    try:
-        return json.loads(text[start_index : end_index + 1])
-    except json.JSONDecodeError:
-        return None
+def _resolve_cache_path(data_dir: Path) -> Path:
+    return data_dir / LESSON_CACHE_FILE
+
+
+def _load_lesson_cache(data_dir: Path) -> Dict[str, dict]:
+    path = _resolve_cache_path(data_dir)
+    if not path.exists():
+        return {}
+    payload = read_json_cached(path)
+    entries = payload.get("entries") if isinstance(payload, dict) else None
+    if not isinstance(entries, dict):
+        return {}
+    return {key: value for key, value in entries.items() if isinstance(value, dict)}
+
+
+def _save_lesson_cache(data_dir: Path, entries: Dict[str, dict], updated_at: str) -> None:
+    # New generations are appended, so insertion order is age order: keep the newest.
+    if len(entries) > LESSON_CACHE_MAX_ENTRIES:
+        entries = dict(list(entries.items())[-LESSON_CACHE_MAX_ENTRIES:])
+    payload = {
+        "entries": entries,
+        "updatedAt": updated_at,
+    }
+    write_json_atomic(_resolve_cache_path(data_dir), payload, fsync=False)
+
+
+def _lesson_cache_key(unit: dict) -> str:
+    return hashlib.blake2b(_lesson_prompt(unit).encode("utf-8"), digest_size=16).hexdigest()
+
+
+_LESSON_PROMPT_PREAMBLE = (
+    "You are generating a Brilliant-style interactive lesson for pharmacy learners.\n"
+    "Return JSON only with this schema:\n"
+    "{\n"
+    "  \"title\": string,\n"
+    "  \"summary\": string,\n"
+    "  \"objectives\": [string],\n"
+    "  \"estimatedReadMinutes\": number,\n"
+    "  \"sections\": [\n"
+    "     {\"heading\": string, \"body\": string, \"checkpoint\": {\"prompt\": string, \"hint\": string}}\n"
+    "  ],\n"
+    "  \"preQuiz\": {\"items\": [{\"type\": string, \"prompt\": string, \"choices\": [string], \"answer\": string}]},\n"
+    "  \"postQuiz\": {\"items\": [{\"type\": string, \"prompt\": string, \"choices\": [string], \"answer\": string}]}\n"
+    "}\n"
+    "Rules:\n"
+    "- Make it interactive, concise, and Socratic.\n"
+    "- Ensure 3-5 sections.\n"
+    "- Pre-quiz is diagnostic (easier). Post-quiz is mastery (harder).\n"
+    "- Pedagogical constraints for quiz items:\n"
+    "  * Open Response and Fill In The Blank: Must be fundamental knowledge questions strictly aligned to the provided learning objectives.\n"
+    "  * Case-Based MCQ: Must use a clinical scenario and require the learner to transfer knowledge from the objectives to a new context (application/analysis).\n"
+    "- Use open response, fill-in, and case-based MCQ across quizzes.\n\n"
+)
 
 
 def _lesson_prompt(unit: dict) -> str:
@@ -121,28 +164,7 @@ def _lesson_prompt(unit: dict) -> str:
     key_points = unit.get("key_points") or []
     summary = unit.get("summary") or ""
 
-    return (
-        "You are generating a Brilliant-style interactive lesson for pharmacy learners.\n"
-        "Return JSON only with this schema:\n"
-        "{\n"
-        "  \"title\": string,\n"
-        "  \"summary\": string,\n"
-        "  \"objectives\": [string],\n"
-        "  \"estimatedReadMinutes\": number,\n"
-        "  \"sections\": [\n"
-        "     {\"heading\": string, \"body\": string, \"checkpoint\": {\"prompt\": string, \"hint\": string}}\n"
-        "  ],\n"
-        "  \"preQuiz\": {\"items\": [{\"type\": string, \"prompt\": string, \"choices\": [string], \"answer\": string}]},\n"
-        "  \"postQuiz\": {\"items\": [{\"type\": string, \"prompt\": string, \"choices\": [string], \"answer\": string}]}\n"
-        "}\n"
-        "Rules:\n"
-        "- Make it interactive, concise, and Socratic.\n"
-        "- Ensure 3-5 sections.\n"
-        "- Pre-quiz is diagnostic (easier). Post-quiz is mastery (harder).\n"
-        "- Pedagogical constraints for quiz items:\n"
-        "  * Open Response and Fill In The Blank: Must be fundamental knowledge questions strictly aligned to the provided learning objectives.\n"
-        "  * Case-Based MCQ: Must use a clinical scenario and require the learner to transfer knowledge from the objectives to a new context (application/analysis).\n"
-        "- Use open response, fill-in, and case-based MCQ across quizzes.\n\n"
+    return _LESSON_PROMPT_PREAMBLE + (
         f"Topic: {unit.get('topic', 'General')}\n"
         f"Summary: {summary}\n"
         f"Learning Objectives: {objectives}\n"
@@ -150,7 +172,8 @@ def _lesson_prompt(unit: dict) -> str:
     )
 
 
-def _gemini_generate(unit: dict) -> Optional[dict]:
+@functools.lru_cache(maxsize=1)
+def _gemini_model() -> Optional[Any]:
     api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
     if not api_key:
         return None
@@ -161,12 +184,52 @@ def _gemini_generate(unit: dict) -> Optional[dict]:
         return None
 
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(DEFAULT_MODEL)
+    return genai.GenerativeModel(DEFAULT_MODEL)
+
+
+def _gemini_generate(unit: dict) -> Optional[dict]:
+    model = _gemini_model()
+    if model is None:
+        return None
+
     response = model.generate_content(_lesson_prompt(unit))
-    return _extract_json_from_text(getattr(response, "text", ""))
+    return extract_json_object(getattr(response, "text", ""))
+
+
+async def _gemini_generate_async(model: Any, unit: dict, semaphore: asyncio.Semaphore) -> Optional[dict]:
+    async with semaphore:
+        response = await model.generate_content_async(_lesson_prompt(unit))
+    return extract_json_object(getattr(response, "text", ""))
+
+
+async def _gemini_generate_all(model: Any, units: List[dict]) -> List[Optional[dict]]:
+    import asyncio
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+    return await asyncio.gather(*(_gemini_generate_async(model, unit, semaphore) for unit in units))
+
+
+def _generate_contents(units: List[dict]) -> List[Optional[dict]]:
+    model = _gemini_model()
+    if model is None:
+        return [None] * len(units)
+    if len(units) <= 1 or not hasattr(model, "generate_content_async"):
+        return [_gemini_generate(unit) for unit in units]
+
+    import asyncio
 
+    return asyncio.run(_gemini_generate_all(model, units))
 
-def _fallback_quiz_items(unit: dict, difficulty: str) -> List[dict]:
+
+_FALLBACK_CASE_CHOICES = (
+    "Apply the primary mechanism directly",
+    "Ignore contraindications",
+    "Delay therapy unnecessarily",
+    "Choose an unrelated pathway",
+)
+
+
+def _fallback_quiz_items(unit: dict) -> List[dict]:
     topic = unit.get("topic", "the concept")
     key_points = unit.get("key_points") or []
     anchor_point = key_points[0] if key_points else topic
@@ -184,13 +247,8 @@ def _fallback_quiz_items(unit: dict, difficulty: str) -> List[dict]:
         {
             "type": "case_mcq",
             "prompt": f"A patient scenario highlights {topic}. Which action aligns with best practice?",
-            "choices": [
-                "Apply the primary mechanism directly",
-                "Ignore contraindications",
-                "Delay therapy unnecessarily",
-                "Choose an unrelated pathway",
-            ],
-            "answer": "Apply the primary mechanism directly",
+            "choices": _FALLBACK_CASE_CHOICES,
+            "answer": _FALLBACK_CASE_CHOICES[0],
         },
     ]
 
@@ -227,22 +285,23 @@ def _fallback_lesson(unit: dict) -> dict:
         )
 
     estimated_read = max(6, 4 + len(key_points))
+    quiz_items = _fallback_quiz_items(unit)
     return {
         "title": title,
         "summary": summary,
         "objectives": objectives,
         "estimatedReadMinutes": estimated_read,
         "sections": sections,
-        "preQuiz": {"items": _fallback_quiz_items(unit, "pre")},
-        "postQuiz": {"items": _fallback_quiz_items(unit, "post")},
+        "preQuiz": {"items": quiz_items},
+        "postQuiz": {"items": list(quiz_items)},
     }
 
 
-def _build_lesson(unit: dict) -> dict:
-    content = _gemini_generate(unit) or _fallback_lesson(unit)
+def _build_lesson(unit: dict, created_at: str, generated: Optional[dict] = None) -> dict:
+    content = generated or _fallback_lesson(unit)
     lesson_id = content.get("id") if isinstance(content, dict) else None
     payload = {
-        "id": lesson_id or str(uuid4()),
+        "id": lesson_id or secrets.token_hex(16),
         "title": content.get("title") if isinstance(content, dict) else unit.get("topic", "Lesson"),
         "summary": content.get("summary") if isinstance(content, dict) else unit.get("summary", ""),
         "objectives": content.get("objectives") if isinstance(content, dict) else unit.get("learning_objectives", []),
@@ -251,7 +310,7 @@ def _build_lesson(unit: dict) -> dict:
         "preQuiz": content.get("preQuiz") if isinstance(content, dict) else {},
         "postQuiz": content.get("postQuiz") if isinstance(content, dict) else {},
         "sourceUnitId": unit.get("id"),
-        "createdAt": datetime.now(tz=timezone.utc).isoformat(),
+        "createdAt": created_at,
         "flow": ["preQuiz", "lesson", "postQuiz"],
     }
     return payload
@@ -264,45 +323,72 @@ def generate_lessons(data_dir: Path, limit: Optional[int] = None) -> LessonPaylo
 
     existing_payload = _load_lessons(data_dir)
     lessons = existing_payload.lessons
-    existing_unit_ids = {lesson.get("sourceUnitId") for lesson in lessons if lesson.get("sourceUnitId")}
+    by_unit_id = existing_payload.by_unit_id
 
-    generated = 0
+    pending: List[dict] = []
     for unit in units:
-        if unit.get("id") in existing_unit_ids:
+        if unit.get("id") in by_unit_id:
             continue
-        lessons.append(_build_lesson(unit))
-        generated += 1
-        if limit and generated >= limit:
+        pending.append(unit)
+        if limit and len(pending) >= limit:
             break
 
-    _save_lessons(data_dir, lessons)
-    return _load_lessons(data_dir)
+    if not pending and existing_payload.source is not None:
+        return existing_payload
+
+    generated_at = datetime.now(tz=timezone.utc).isoformat()
+    cache = _load_lesson_cache(data_dir)
+    keys = [_lesson_cache_key(unit) for unit in pending]
+    misses = [index for index, key in enumerate(keys) if key not in cache]
+    generated_contents = _generate_contents([pending[index] for index in misses])
+    for index, generated in zip(misses, generated_contents):
+        if generated:
+            cache[keys[index]] = generated
+
+    for unit, key in zip(pending, keys):
+        lesson = _build_lesson(unit, generated_at, cache.get(key))
+        lessons.append(lesson)
+        if lesson["sourceUnitId"]:
+            by_unit_id[lesson["sourceUnitId"]] = lesson
+
+    if any(generated_contents):
+        _save_lesson_cache(data_dir, cache, generated_at)
+
+    _save_lessons(data_dir, lessons, generated_at)
+    return _lesson_payload(_resolve_lessons_path(data_dir), lessons, by_unit_id)
 
 
 def main() -> int:
+    import argparse
+
     parser = argparse.ArgumentParser(description="Lesson generation utilities")
     parser.add_argument("--data-dir", help="Override lesson plan data directory")
     parser.add_argument("--generate", action="store_true", help="Generate lessons from knowledge units")
     parser.add_argument("--limit", type=int, default=1, help="Limit number of generated lessons")
+    parser.add_argument("--since", type=int, help="Skip the read if the store mtime (ns) still equals this value")
     args = parser.parse_args()
 
-    data_dir = _resolve_data_dir(Path(args.data_dir) if args.data_dir else None)
+    data_dir = resolve_data_dir(Path(args.data_dir) if args.data_dir else None)
     if data_dir is None:
         raise FileNotFoundError("Unable to resolve data directory")
 
+    store_path = _resolve_lessons_path(data_dir)
+    if not args.generate and args.since is not None and file_mtime_ns(store_path) == args.since:
+        write_json_stdout({"unchanged": True, "mtimeNs": args.since})
+        return 0
+
     if args.generate:
         payload = generate_lessons(data_dir, limit=args.limit)
     else:
         payload = _load_lessons(data_dir)
 
-    print(
-        json.dumps(
-            {
-                "lessons": payload.lessons,
-                "source": payload.source,
-                "lastUpdated": payload.last_updated,
-            }
-        )
+    write_json_stdout(
+        {
+            "lessons": payload.lessons,
+            "source": payload.source,
+            "lastUpdated": payload.last_updated,
+            "mtimeNs": file_mtime_ns(store_path),
+        }
     )
     return 0
 
@@ -5,18 +5,60 @@ This module defines the data structures for Knowledge Units, Nodes, and Edges.
 
 from __future__ import annotations
 
+import functools
+import heapq
+import itertools
 import json
+import mmap
 import os
+import re
+import secrets
+import sys
 import time
+from collections import Counter
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from enum import Enum
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
-from uuid import UUID, uuid4
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional
+from uuid import UUID
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+    HAS_ORJSON = False
 
-@dataclass(frozen=True)
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+
+_id_prefix = secrets.randbits(64) << 64
+_id_counter = itertools.count()
+
+
+def new_id() -> UUID:
+    """Return a process-unique UUID: a random 64-bit prefix plus a counter, with no syscall per id."""
+    return UUID(int=_id_prefix | next(_id_counter))
+
+
+def _reseed_ids() -> None:
+    global _id_prefix, _id_counter
+    _id_prefix = secrets.randbits(64) << 64
+    _id_counter = itertools.count()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_ids)
+
+
+@dataclass(frozen=True, slots=True)
 class VisualRepresentation:
     type: str  # e.g., "diagram", "chart", "map"
     data: Any  # JSON-serializable structure for rendering
@@ -24,7 +66,7 @@ class VisualRepresentation:
     function_logic: Optional[str] = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class KnowledgeUnit:
     id: UUID
     topic: str
@@ -45,20 +87,20 @@ class KnowledgeUnit:
         learning_objectives: Optional[Iterable[str]] = None,
         visualizations: Optional[Iterable[VisualRepresentation]] = None,
     ) -> "KnowledgeUnit":
-        topic_value = topic.strip() if topic and topic.strip() else "General"
-        subtopic_value = subtopic.strip() if subtopic and subtopic.strip() else ""
-        summary_value = summary.strip() if summary and summary.strip() else ""
+        topic_value = (topic.strip() or "General") if topic else "General"
+        subtopic_value = subtopic.strip() if subtopic else ""
+        summary_value = summary.strip() if summary else ""
 
-        points = [point.strip() for point in key_points if point and point.strip()]
+        points = [stripped for point in key_points if point and (stripped := point.strip())]
         objectives = (
-            [objective.strip() for objective in learning_objectives if objective and objective.strip()]
+            [stripped for objective in learning_objectives if objective and (stripped := objective.strip())]
             if learning_objectives
             else []
         )
         visuals = list(visualizations) if visualizations else []
 
         return KnowledgeUnit(
-            id=uuid4(),
+            id=new_id(),
             topic=topic_value,
             subtopic=subtopic_value,
             source_slide_id=source_slide_id,
@@ -84,7 +126,7 @@ class DomainEdgeType(str, Enum):
     CONTRASTS_WITH = "ContrastsWith"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DomainNode:
     id: UUID
     title: str
@@ -96,7 +138,7 @@ class DomainNode:
     tags: List[str]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DomainEdge:
     id: UUID
     from_node_id: UUID
@@ -105,123 +147,349 @@ class DomainEdge:
     strength: float = 1.0
 
 
+def _cached_traversal(method):
+    @functools.wraps(method)
+    def wrapper(self: "DomainKnowledgeGraph", node_id: UUID) -> List[DomainNode]:
+        key = (method.__name__, node_id)
+        cached = self._traversal_cache.get(key)
+        if cached is None:
+            cached = self._traversal_cache[key] = method(self, node_id)
+        return list(cached)
+
+    return wrapper
+
+
 class DomainKnowledgeGraph:
     def __init__(self) -> None:
         self._nodes: Dict[UUID, DomainNode] = {}
         self._edges: Dict[UUID, DomainEdge] = {}
-        self._outgoing_edges: Dict[UUID, List[DomainEdge]] = {}
-        self._incoming_edges: Dict[UUID, List[DomainEdge]] = {}
+        # Nodes are interned to dense integer slots on first insert; adjacency is kept as
+        # per-type lists of neighbour slots so traversals index lists instead of hashing UUIDs.
+        self._slot_of: Dict[UUID, int] = {}
+        self._slot_nodes: List[DomainNode] = []
+        self._outgoing_slots: List[Dict[DomainEdgeType, List[int]]] = []
+        self._incoming_slots: List[Dict[DomainEdgeType, List[int]]] = []
+        self._nodes_by_type: Dict[DomainNodeType, List[DomainNode]] = {}
+        # Traversal results keyed by (method, node id); any mutation clears it.
+        self._traversal_cache: Dict[tuple[str, UUID], List[DomainNode]] = {}
+        self._nodes_view = MappingProxyType(self._nodes)
+        self._edges_view = MappingProxyType(self._edges)
 
     @property
-    def nodes(self) -> Dict[UUID, DomainNode]:
-        return dict(self._nodes)
+    def nodes(self) -> Mapping[UUID, DomainNode]:
+        return self._nodes_view
 
     @property
-    def edges(self) -> Dict[UUID, DomainEdge]:
-        return dict(self._edges)
+    def edges(self) -> Mapping[UUID, DomainEdge]:
+        return self._edges_view
 
     def add_node(self, node: DomainNode) -> None:
         if node is None:
             raise ValueError("node cannot be None")
+        self._traversal_cache.clear()
+        slot = self._slot_of.get(node.id)
+        if slot is None:
+            self._slot_of[node.id] = len(self._slot_nodes)
+            self._slot_nodes.append(node)
+            self._outgoing_slots.append({})
+            self._incoming_slots.append({})
+        else:
+            previous = self._slot_nodes[slot]
+            self._nodes_by_type[previous.type].remove(previous)
+            self._slot_nodes[slot] = node
         self._nodes[node.id] = node
-        self._outgoing_edges.setdefault(node.id, [])
-        self._incoming_edges.setdefault(node.id, [])
+        self._nodes_by_type.setdefault(node.type, []).append(node)
 
     def add_edge(self, edge: DomainEdge) -> None:
         if edge is None:
             raise ValueError("edge cannot be None")
-        if edge.from_node_id not in self._nodes:
+        from_slot = self._slot_of.get(edge.from_node_id)
+        if from_slot is None:
             raise ValueError(f"Source node {edge.from_node_id} does not exist.")
-        if edge.to_node_id not in self._nodes:
+        to_slot = self._slot_of.get(edge.to_node_id)
+        if to_slot is None:
             raise ValueError(f"Target node {edge.to_node_id} does not exist.")
 
+        self._traversal_cache.clear()
         self._edges[edge.id] = edge
-        self._outgoing_edges[edge.from_node_id].append(edge)
-        self._incoming_edges[edge.to_node_id].append(edge)
+        self._outgoing_slots[from_slot].setdefault(edge.type, []).append(to_slot)
+        self._incoming_slots[to_slot].setdefault(edge.type, []).append(from_slot)
 
     def get_node(self, node_id: UUID) -> Optional[DomainNode]:
         return self._nodes.get(node_id)
 
     def get_nodes_by_type(self, node_type: DomainNodeType) -> List[DomainNode]:
-        return [node for node in self._nodes.values() if node.type == node_type]
+        return list(self._nodes_by_type.get(node_type, ()))
 
+    @_cached_traversal
     def get_prerequisites(self, node_id: UUID) -> List[DomainNode]:
-        edges = self._outgoing_edges.get(node_id, [])
-        prerequisites = [
-            self.get_node(edge.to_node_id)
-            for edge in edges
-            if edge.type == DomainEdgeType.PREREQUISITE_OF
+        slot = self._slot_of.get(node_id)
+        if slot is None:
+            return []
+        slot_nodes = self._slot_nodes
+        return [
+            slot_nodes[target]
+            for target in self._outgoing_slots[slot].get(DomainEdgeType.PREREQUISITE_OF, ())
         ]
-        return [node for node in prerequisites if node is not None]
 
+    @_cached_traversal
     def get_related_nodes(self, node_id: UUID) -> List[DomainNode]:
-        related: List[DomainNode] = []
-
-        outgoing = self._outgoing_edges.get(node_id, [])
-        related.extend(
-            self.get_node(edge.to_node_id)
-            for edge in outgoing
-            if edge.type == DomainEdgeType.RELATED_TO
-        )
-
-        incoming = self._incoming_edges.get(node_id, [])
-        related.extend(
-            self.get_node(edge.from_node_id)
-            for edge in incoming
-            if edge.type == DomainEdgeType.RELATED_TO
+        slot = self._slot_of.get(node_id)
+        if slot is None:
+            return []
+        related: Dict[int, None] = dict.fromkeys(
+            self._outgoing_slots[slot].get(DomainEdgeType.RELATED_TO, ())
         )
-
-        unique = {node.id: node for node in related if node is not None}
-        return list(unique.values())
+        related.update(dict.fromkeys(self._incoming_slots[slot].get(DomainEdgeType.RELATED_TO, ())))
+        slot_nodes = self._slot_nodes
+        return [slot_nodes[related_slot] for related_slot in related]
 
 
 DEFAULT_MASTERY_LEVELS = ["Advanced", "Proficient", "Developing", "Novice", "Unknown"]
 
-_LOCK_TIMEOUT_SECONDS = 2.0
-_LOCK_SLEEP_SECONDS = 0.05
+_MMAP_MIN_BYTES = 256 * 1024
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+_JSON_BRACE_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}]', re.DOTALL)
 
 
-def _acquire_file_lock(lock_path: Path, timeout: float = _LOCK_TIMEOUT_SECONDS) -> int:
-    start = time.monotonic()
-    while True:
-        try:
-            return os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_RDWR)
-        except FileExistsError as exc:
-            if time.monotonic() - start >= timeout:
-                raise RuntimeError("Database locked") from exc
-            time.sleep(_LOCK_SLEEP_SECONDS)
+def _acquire_file_lock(lock_path: Path) -> int:
+    # The lock file stays in place; the kernel lock is what serializes writers and
+    # it is dropped automatically if the holder dies, so there is no stale-lock cleanup.
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+    except OSError as exc:
+        os.close(fd)
+        raise RuntimeError("Database locked") from exc
+    return fd
 
 
-def _release_file_lock(lock_path: Path, fd: int) -> None:
+def _release_file_lock(fd: int) -> None:
     try:
-        os.close(fd)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
     finally:
-        try:
-            lock_path.unlink()
-        except FileNotFoundError:
-            pass
+        os.close(fd)
+
+
+def json_loads(data: bytes | str) -> Any:
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_dumps(payload: Any, *, indent: Optional[int] = None) -> bytes:
+    if HAS_ORJSON and indent in (None, 2):
+        option = orjson.OPT_INDENT_2 if indent == 2 else 0
+        return orjson.dumps(payload, default=_json_default, option=option)
+    return json.dumps(payload, indent=indent, default=_json_default).encode("utf-8")
+
+
+def read_json(path: Path) -> Any:
+    with path.open("rb") as handle:
+        size = os.fstat(handle.fileno()).st_size
+        if size < _MMAP_MIN_BYTES:
+            return json_loads(handle.read())
+
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            if not HAS_ORJSON:
+                return json.loads(mapped[:])
+            view = memoryview(mapped)
+            try:
+                return orjson.loads(view)
+            finally:
+                view.release()
+
+
+def read_json_cached(path: Path) -> Any:
+    """Return the parsed JSON at ``path``, reusing the last parse while the file is unchanged.
+
+    The result is shared between callers and must be treated as read-only.
+    """
+    stat = path.stat()
+    return _read_json_for_stat(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=16)
+def _read_json_for_stat(path_str: str, mtime_ns: int, size: int) -> Any:
+    return read_json(Path(path_str))
+
+
+def extract_json_object(text: str) -> Optional[dict]:
+    """Parse the first JSON object embedded in free-form model output."""
+    if not text:
+        return None
+    text = text.strip()
+    if text.startswith("{") and text.endswith("}"):
+        parsed = _loads_object(text)
+        if parsed is not None:
+            return parsed
+
+    match = _JSON_FENCE_RE.search(text)
+    if match:
+        parsed = _loads_object(match.group(1))
+        if parsed is not None:
+            return parsed
+
+    start_index = text.find("{")
+    while start_index != -1:
+        end_index = _find_object_end(text, start_index)
+        if end_index == -1:
+            return None
+        parsed = _loads_object(text[start_index:end_index])
+        if parsed is not None:
+            return parsed
+        start_index = text.find("{", end_index)
+    return None
+
+
+def _find_object_end(text: str, start_index: int) -> int:
+    depth = 0
+    for token in _JSON_BRACE_TOKEN_RE.finditer(text, start_index):
+        value = token.group()
+        if value == "{":
+            depth += 1
+        elif value == "}":
+            depth -= 1
+            if depth == 0:
+                return token.end()
+    return -1
+
+
+def _loads_object(text: str) -> Optional[dict]:
+    try:
+        parsed = json_loads(text)
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def file_mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+_is_dict = dict.__instancecheck__
+
+
+def filter_dicts(items: Any) -> List[dict]:
+    if not isinstance(items, list):
+        return []
+    return list(filter(_is_dict, items))
+
+
+def write_json_stdout(payload: Any) -> None:
+    sys.stdout.flush()
+    sys.stdout.buffer.write(json_dumps(payload))
+    sys.stdout.buffer.write(b"\n")
+    sys.stdout.buffer.flush()
+
+
+def json_document_chunks(field_name: str, items: Iterable[Any], **extra: Any) -> Iterator[bytes]:
+    """Yield ``{"<field_name>": [items...], **extra}`` as compact JSON, one item at a time."""
+    yield b"{" + json_dumps(field_name) + b":["
+    for index, item in enumerate(items):
+        if index:
+            yield b","
+        yield json_dumps(item)
+    yield b"]"
+    for key, value in extra.items():
+        yield b"," + json_dumps(key) + b":" + json_dumps(value)
+    yield b"}"
+
 
+def write_json_atomic(target_path: Path, payload: Any, *, indent: Optional[int] = 2, fsync: bool = True) -> None:
+    data = payload if isinstance(payload, bytes) else json_dumps(payload, indent=indent)
+    write_json_chunks_atomic(target_path, (data,), fsync=fsync)
 
-def write_json_atomic(target_path: Path, payload: Any, *, indent: int = 2) -> None:
+
+def write_json_chunks_atomic(target_path: Path, chunks: Iterable[bytes], *, fsync: bool = True) -> None:
     target_path.parent.mkdir(parents=True, exist_ok=True)
-    lock_path = target_path.with_suffix(target_path.suffix + ".lock")
-    temp_path = target_path.with_name(
-        f".{target_path.name}.{os.getpid()}.{int(time.time() * 1000)}.tmp"
-    )
-    fd = _acquire_file_lock(lock_path)
+    temp_path = _temp_path_for(target_path)
+    fd = _acquire_file_lock(_lock_path_for(target_path))
     try:
-        with temp_path.open("w", encoding="utf-8") as handle:
-            json.dump(payload, handle, indent=indent)
-            handle.flush()
-            os.fsync(handle.fileno())
+        with temp_path.open("wb") as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+            if fsync:
+                handle.flush()
+                os.fsync(handle.fileno())
         os.replace(temp_path, target_path)
     finally:
-        if temp_path.exists():
-            try:
-                temp_path.unlink()
-            except OSError:
-                pass
-        _release_file_lock(lock_path, fd)
+        _discard_temp(temp_path)
+        _release_file_lock(fd)
+
+
+def write_json_atomic_batch(
+    items: Iterable[tuple[Path, Any]],
+    *,
+    indent: Optional[int] = 2,
+    fsync: bool = True,
+) -> None:
+    """Write several JSON files, syncing every temp file before any of them is renamed into place."""
+    pending = sorted(
+        ((target_path, _temp_path_for(target_path), payload) for target_path, payload in items),
+        key=lambda entry: str(entry[0]),
+    )
+    lock_fds: List[int] = []
+    try:
+        for target_path, _, _ in pending:
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            lock_fds.append(_acquire_file_lock(_lock_path_for(target_path)))
+        handles = []
+        try:
+            for _, temp_path, payload in pending:
+                handle = temp_path.open("wb")
+                handles.append(handle)
+                handle.write(payload if isinstance(payload, bytes) else json_dumps(payload, indent=indent))
+                handle.flush()
+            if fsync:
+                for handle in handles:
+                    os.fsync(handle.fileno())
+        finally:
+            for handle in handles:
+                handle.close()
+        for target_path, temp_path, _ in pending:
+            os.replace(temp_path, target_path)
+    finally:
+        for _, temp_path, _ in pending:
+            _discard_temp(temp_path)
+        for fd in reversed(lock_fds):
+            _release_file_lock(fd)
+
+
+def _lock_path_for(target_path: Path) -> Path:
+    return target_path.with_suffix(target_path.suffix + ".lock")
+
+
+def _temp_path_for(target_path: Path) -> Path:
+    return target_path.with_name(
+        f".{target_path.name}.{os.getpid()}.{int(time.time() * 1000)}.tmp"
+    )
+
+
+def _discard_temp(temp_path: Path) -> None:
+    if temp_path.exists():
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
 
 
 @dataclass(frozen=True)
@@ -243,7 +511,7 @@ class GraphSummary:
             0,
             0,
             {},
-            {level: 0 for level in DEFAULT_MASTERY_LEVELS},
+            dict(_EMPTY_MASTERY_LEVELS),
             {},
             [],
             {"dueCount": 0, "nextReviewAt": None},
@@ -266,8 +534,9 @@ class GraphSummary:
         edges = _extract_items(graph_payload.get("Edges") or graph_payload.get("edges"))
         node_types = _build_node_type_counts(nodes)
         blooms_distribution = _build_blooms_distribution(nodes)
-        mastery_levels, recent_topics, diff_mastery = _build_mastery_snapshot(student_state, nodes, recent_limit)
-        spaced_repetition = _build_spaced_repetition_snapshot(student_state)
+        mastery_levels, recent_topics, diff_mastery, spaced_repetition = _build_student_snapshot(
+            student_state, nodes, recent_limit
+        )
         return cls(
             len(nodes),
             len(edges),
@@ -296,132 +565,109 @@ class GraphSummary:
         }
 
 
+_EMPTY_MASTERY_LEVELS = MappingProxyType({level: 0 for level in DEFAULT_MASTERY_LEVELS})
+
+
 def _build_node_type_counts(nodes: List[dict]) -> Dict[str, int]:
-    type_counts: Dict[str, int] = {}
-    for node in nodes:
-        node_type = _get_value(node, "Type", "type")
-        if isinstance(node_type, dict):
-            node_type = _get_value(node_type, "Value", "value")
-        if node_type is None:
-            node_type = DomainNodeType.CONCEPT.value
-        type_name = str(node_type)
-        type_counts[type_name] = type_counts.get(type_name, 0) + 1
-    return type_counts
+    return dict(Counter(map(_node_type_name, nodes)))
+
+
+def _node_type_name(node: dict) -> str:
+    node_type = _get_value(node, "Type", "type")
+    if isinstance(node_type, dict):
+        node_type = _get_value(node_type, "Value", "value")
+    if node_type is None:
+        return DomainNodeType.CONCEPT.value
+    return str(node_type)
 
 
 def _build_blooms_distribution(nodes: List[dict]) -> Dict[str, int]:
-    distribution: Dict[str, int] = {}
-    for node in nodes:
-        blooms = _get_value(node, "blooms_level", "BloomsLevel", "bloomsLevel") or "Unknown"
-        distribution[blooms] = distribution.get(blooms, 0) + 1
-    return distribution
+    return dict(
+        Counter(_get_value(node, "blooms_level", "BloomsLevel", "bloomsLevel") or "Unknown" for node in nodes)
+    )
 
 
-def _build_mastery_snapshot(
+def _build_student_snapshot(
     student_state: Optional[dict],
     nodes: List[dict],
     recent_limit: int,
-) -> tuple[Dict[str, int], List[Dict[str, str]], List[Dict[str, float]]]:
-    mastery_levels = {level: 0 for level in DEFAULT_MASTERY_LEVELS}
-    difficulty_mastery: List[Dict[str, float]] = []
-    
+) -> tuple[Dict[str, int], List[Dict[str, str]], List[Dict[str, float]], Dict[str, Optional[str]]]:
+    mastery_levels = dict(_EMPTY_MASTERY_LEVELS)
+
     if not isinstance(student_state, dict):
-        return mastery_levels, [], []
+        return mastery_levels, [], [], {"dueCount": 0, "nextReviewAt": None}
 
     mastery_data = student_state.get("knowledgeMasteries") or student_state.get("KnowledgeMasteries")
     mastery_items = _extract_items(mastery_data)
-    
+
     mastery_by_node: Dict[str, dict] = {}
+    recent_candidates: List[tuple[datetime, Any, str]] = []
+    due_count = 0
+    next_review: Optional[datetime] = None
+    now = datetime.utcnow()
+
     for mastery in mastery_items:
         node_id = _get_value(mastery, "domainNodeId", "DomainNodeId", "nodeId", "NodeId")
         if node_id:
             mastery_by_node[str(node_id)] = mastery
 
-    nodes_by_id: Dict[str, str] = {}
-    for node in nodes:
-        node_id = _get_value(node, "id", "Id")
-        title = _get_value(node, "title", "Title") or "Untitled topic"
-        difficulty = _get_value(node, "difficulty", "Difficulty") or 0.0
-        
-        if node_id:
-            node_id_str = str(node_id)
-            nodes_by_id[node_id_str] = title
-            
-            mastery_entry = mastery_by_node.get(node_id_str)
-            score = _get_value(mastery_entry, "score", "Score") if mastery_entry else 0.0
-            difficulty_mastery.append({
-                "difficulty": float(difficulty),
-                "mastery": float(score)
-            })
-
-    recent_candidates: List[tuple[datetime, Dict[str, str]]] = []
-
-    for mastery in mastery_items:
         level_value = _get_value(mastery, "level", "Level")
         level_name = _normalize_mastery_level(level_value)
         mastery_levels[level_name] = mastery_levels.get(level_name, 0) + 1
 
-        last_assessed_value = _get_value(mastery, "lastAssessed", "LastAssessed")
-        last_assessed = _parse_timestamp(last_assessed_value)
-        if last_assessed is None:
-            continue
-
-        node_id = _get_value(mastery, "domainNodeId", "DomainNodeId", "nodeId", "NodeId")
-        title = nodes_by_id.get(str(node_id)) if node_id else None
-        if not title:
-            title = "Untitled topic"
-
-        recent_candidates.append(
-            (
-                last_assessed,
-                {
-                    "title": title,
-                    "level": level_name,
-                    "lastAssessed": _format_timestamp(last_assessed),
-                },
-            )
-        )
-
-    recent_candidates.sort(key=lambda item: item[0], reverse=True)
-    recent_topics = [topic for _, topic in recent_candidates[:recent_limit]]
-    return mastery_levels, recent_topics, difficulty_mastery
+        review_time = _parse_timestamp(_get_value(mastery, "nextReviewAt", "NextReviewAt"))
+        if review_time is not None:
+            if review_time <= now:
+                due_count += 1
+            elif next_review is None or review_time < next_review:
+                next_review = review_time
 
+        last_assessed = _parse_timestamp(_get_value(mastery, "lastAssessed", "LastAssessed"))
+        if last_assessed is not None:
+            recent_candidates.append((last_assessed, node_id, level_name))
 
-def _build_spaced_repetition_snapshot(student_state: Optional[dict]) -> Dict[str, Optional[str]]:
-    if not isinstance(student_state, dict):
-        return {"dueCount": 0, "nextReviewAt": None}
-
-    mastery_data = student_state.get("knowledgeMasteries") or student_state.get("KnowledgeMasteries")
-    mastery_items = _extract_items(mastery_data)
-
-    due_count = 0
-    next_review: Optional[datetime] = None
-    now = datetime.utcnow()
-
-    for mastery in mastery_items:
-        next_review_value = _get_value(mastery, "nextReviewAt", "NextReviewAt")
-        review_time = _parse_timestamp(next_review_value)
-        if review_time is None:
-            continue
-        if review_time <= now:
-            due_count += 1
+    nodes_by_id: Dict[str, str] = {}
+    difficulty_mastery: List[Dict[str, float]] = []
+    for node in nodes:
+        node_id = _get_value(node, "id", "Id")
+        if not node_id:
             continue
-        if next_review is None or review_time < next_review:
-            next_review = review_time
+        node_id_str = str(node_id)
+        nodes_by_id[node_id_str] = _get_value(node, "title", "Title") or "Untitled topic"
 
-    return {
+        difficulty = _get_value(node, "difficulty", "Difficulty") or 0.0
+        mastery_entry = mastery_by_node.get(node_id_str)
+        score = _get_value(mastery_entry, "score", "Score") if mastery_entry else 0.0
+        difficulty_mastery.append({
+            "difficulty": float(difficulty),
+            "mastery": float(score)
+        })
+
+    recent_topics = [
+        {
+            "title": (nodes_by_id.get(str(node_id)) if node_id else None) or "Untitled topic",
+            "level": level_name,
+            "lastAssessed": _format_timestamp(last_assessed),
+        }
+        for last_assessed, node_id, level_name in heapq.nlargest(
+            recent_limit, recent_candidates, key=itemgetter(0)
+        )
+    ]
+
+    spaced_repetition = {
         "dueCount": due_count,
         "nextReviewAt": _format_timestamp(next_review) if next_review else None,
     }
+    return mastery_levels, recent_topics, difficulty_mastery, spaced_repetition
 
 
 def _extract_items(raw: Any) -> List[dict]:
     if raw is None:
         return []
     if isinstance(raw, dict):
-        return [value for value in raw.values() if isinstance(value, dict)]
+        return list(filter(_is_dict, raw.values()))
     if isinstance(raw, list):
-        return [item for item in raw if isinstance(item, dict)]
+        return list(filter(_is_dict, raw))
     return []
 
 
@@ -466,19 +712,25 @@ def _parse_timestamp(value: Any) -> Optional[datetime]:
         except (OSError, ValueError):
             return None
     if isinstance(value, str):
-        cleaned = value.replace("Z", "+00:00")
-        try:
-            parsed = datetime.fromisoformat(cleaned)
-            if parsed.year <= 1:
-                return None
-            if parsed.tzinfo is None:
-                return parsed
-            return parsed.astimezone(timezone.utc).replace(tzinfo=None)
-        except ValueError:
-            return None
+        return _parse_timestamp_text(value)
     return None
 
 
+@functools.lru_cache(maxsize=4096)
+def _parse_timestamp_text(value: str) -> Optional[datetime]:
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.year <= 1:
+        return None
+    if parsed.tzinfo is None:
+        return parsed
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 def _format_timestamp(value: datetime) -> str:
     if value.tzinfo is None:
         return value.isoformat() + "Z"
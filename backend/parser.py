@@ -1,45 +1,57 @@
 """
 Lecture Slide Parser for CAT-Pharmacy.
-Extracts structured Knowledge Units from PowerPoint (.pptx) files using python-pptx.
+Extracts structured Knowledge Units from PowerPoint (.pptx) files by reading the slide XML parts directly.
 """
 
 from __future__ import annotations
 
-import argparse
-import json
+import functools
+import posixpath
 import re
+import zipfile
 from pathlib import Path
-from typing import List
-
-try:
-    from pptx import Presentation
-    from pptx.enum.shapes import PP_PLACEHOLDER
-    HAS_PPTX = True
-except ImportError:  # pragma: no cover - guarded at runtime
-    Presentation = None
-    PP_PLACEHOLDER = None
-    HAS_PPTX = False
-
-from backend.models import KnowledgeUnit
-
-
-NOISE_PATTERNS = [
-    re.compile(r"(\d{3}-\d{3}-\d{4})", re.IGNORECASE),
-    re.compile(r"Room\s+#?\d+", re.IGNORECASE),
-    re.compile(r"@uams.edu", re.IGNORECASE),
-    re.compile(r"www\.", re.IGNORECASE),
-    re.compile(r"http", re.IGNORECASE),
-]
+from typing import Dict, Iterator, List, Optional, Sequence
+from xml.etree import ElementTree
+
+from backend.models import KnowledgeUnit, write_json_stdout
+
+
+_PRESENTATION_PART = "ppt/presentation.xml"
+_PRESENTATION_RELS_PART = "ppt/_rels/presentation.xml.rels"
+_NS = {
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+_SHAPE_TAG = f"{{{_NS['p']}}}sp"
+_REL_ID_ATTR = f"{{{_NS['r']}}}id"
+_TITLE_PLACEHOLDER_TYPES = {"title", "ctrTitle"}
+
+
+NOISE_PATTERN = re.compile(
+    "|".join(
+        [
+            r"\d{3}-\d{3}-\d{4}",
+            r"Room\s+#?\d+",
+            r"@uams.edu",
+            r"www\.",
+            r"http",
+        ]
+    ),
+    re.IGNORECASE,
+)
+LEARNING_OBJECTIVES_PATTERN = re.compile(
+    r"learning objective|objectives|learning outcome|goals",
+    re.IGNORECASE,
+)
 
 
 def parse_pptx(file_path: str) -> List[KnowledgeUnit]:
-    if not HAS_PPTX or Presentation is None:
-        raise RuntimeError("python-pptx is required to parse PPTX files")
-    presentation = Presentation(file_path)
     units: List[KnowledgeUnit] = []
     global_learning_objectives: List[str] = []
 
-    for slide_index, slide in enumerate(presentation.slides, start=1):
+    for slide_index, slide in enumerate(_iter_slides(file_path), start=1):
         slide_content = _extract_slide_content(slide)
 
         if _is_learning_objectives_slide(slide_content.title):
@@ -60,28 +72,66 @@ def parse_pptx(file_path: str) -> List[KnowledgeUnit]:
     return units
 
 
-def _is_learning_objectives_slide(title: str | None) -> bool:
-    if not title or not title.strip():
-        return False
+def parse_pptx_batch(file_paths: Sequence[str], workers: Optional[int] = None) -> List[List[dict]]:
+    if len(file_paths) <= 1 or workers == 1:
+        return [_parse_pptx_dicts(file_path) for file_path in file_paths]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_parse_pptx_dicts, file_paths))
+
+
+def _parse_pptx_dicts(file_path: str) -> List[dict]:
+    return [_knowledge_unit_to_dict(unit) for unit in parse_pptx(file_path)]
+
+
+def _iter_slides(file_path: str) -> Iterator[ElementTree.Element]:
+    with zipfile.ZipFile(file_path) as package:
+        try:
+            for part_name in _slide_part_names(package):
+                with package.open(part_name) as part:
+                    yield ElementTree.parse(part).getroot()
+        except (KeyError, ElementTree.ParseError) as exc:
+            raise ValueError(f"PPTX package not found or malformed: {exc}") from exc
+
+
+def _slide_part_names(package: zipfile.ZipFile) -> List[str]:
+    with package.open(_PRESENTATION_RELS_PART) as part:
+        relationships = ElementTree.parse(part).getroot()
+    targets: Dict[str, str] = {}
+    for relationship in relationships.iterfind("rel:Relationship", _NS):
+        target = relationship.get("Target") or ""
+        if target.startswith("/"):
+            part_name = target.lstrip("/")
+        else:
+            part_name = posixpath.normpath(posixpath.join("ppt", target))
+        targets[relationship.get("Id")] = part_name
 
-    lower_title = title.lower()
-    return (
-        "learning objective" in lower_title
-        or "objectives" in lower_title
-        or "learning outcome" in lower_title
-        or "goals" in lower_title
-    )
+    with package.open(_PRESENTATION_PART) as part:
+        presentation = ElementTree.parse(part).getroot()
+    slide_ids = presentation.iterfind("p:sldIdLst/p:sldId", _NS)
+    return [targets[slide_id.get(_REL_ID_ATTR)] for slide_id in slide_ids]
 
 
-def _extract_slide_content(slide) -> "SlideContent":
+def _is_learning_objectives_slide(title: str | None) -> bool:
+    return bool(title) and LEARNING_OBJECTIVES_PATTERN.search(title) is not None
+
+
+def _extract_slide_content(slide: ElementTree.Element) -> "SlideContent":
     title = ""
     key_points: List[str] = []
 
-    for shape in slide.shapes:
-        if not shape.has_text_frame:
+    shape_tree = slide.find("p:cSld/p:spTree", _NS)
+    shapes = list(shape_tree) if shape_tree is not None else []
+    for shape in shapes:
+        if shape.tag != _SHAPE_TAG:
+            continue
+        text_body = shape.find("p:txBody", _NS)
+        if text_body is None:
             continue
 
-        text = _extract_text_from_shape(shape)
+        text = _extract_text_from_body(text_body)
         if not text.strip():
             continue
 
@@ -91,6 +141,14 @@ def _extract_slide_content(slide) -> "SlideContent":
                 title = trimmed
             continue
 
+        # Any per-line match is also a match in the whole frame, so one scan of the
+        # frame lets the common noise-free case skip the per-line regex entirely.
+        if NOISE_PATTERN.search(text) is None:
+            key_points.extend(
+                trimmed for line in _split_lines(text) if len(trimmed := line.strip()) >= 2
+            )
+            continue
+
         for line in _split_lines(text):
             trimmed = line.strip()
             if trimmed and not _is_noise(trimmed):
@@ -99,38 +157,27 @@ def _extract_slide_content(slide) -> "SlideContent":
     return SlideContent(title=title, key_points=key_points)
 
 
-def _is_shape_title(shape) -> bool:
-    if not shape.is_placeholder:
+def _is_shape_title(shape: ElementTree.Element) -> bool:
+    placeholder = shape.find("p:nvSpPr/p:nvPr/p:ph", _NS)
+    if placeholder is None:
         return False
-    placeholder_type = shape.placeholder_format.type
-    return placeholder_type in {
-        PP_PLACEHOLDER.TITLE,
-        PP_PLACEHOLDER.CENTER_TITLE,
-    }
-
+    return placeholder.get("type") in _TITLE_PLACEHOLDER_TYPES
 
-def _extract_text_from_shape(shape) -> str:
-    text_frame = shape.text_frame
-    if text_frame is None:
-        return ""
 
+def _extract_text_from_body(text_body: ElementTree.Element) -> str:
     lines: List[str] = []
-    for paragraph in text_frame.paragraphs:
-        runs_text = "".join(run.text or "" for run in paragraph.runs)
+    for paragraph in text_body.iterfind("a:p", _NS):
+        runs_text = "".join(run.text or "" for run in paragraph.iterfind("a:r/a:t", _NS))
         lines.append(runs_text)
     return "\n".join(lines)
 
 
 def _split_lines(text: str) -> List[str]:
-    return [line for line in re.split(r"[\r\n]+", text) if line]
+    return [line for line in text.splitlines() if line]
 
 
-def _is_noise(text: str) -> bool:
-    if not text or not text.strip():
-        return True
-    if len(text.strip()) < 2:
-        return True
-    return any(pattern.search(text) for pattern in NOISE_PATTERNS)
+def _is_noise(stripped: str) -> bool:
+    return len(stripped) < 2 or NOISE_PATTERN.search(stripped) is not None
 
 
 def _knowledge_unit_to_dict(unit: KnowledgeUnit) -> dict:
@@ -151,10 +198,17 @@ class SlideContent:
         self.key_points = key_points
 
 
-def main() -> int:
+@functools.lru_cache(maxsize=1)
+def _build_arg_parser():
+    import argparse
+
     parser = argparse.ArgumentParser(description="Parse PPTX content into knowledge units.")
     parser.add_argument("file_path", help="Path to the .pptx file")
-    args = parser.parse_args()
+    return parser
+
+
+def main() -> int:
+    args = _build_arg_parser().parse_args()
 
     file_path = Path(args.file_path)
     if not file_path.exists():
@@ -162,7 +216,7 @@ def main() -> int:
 
     units = parse_pptx(str(file_path))
     payload = [_knowledge_unit_to_dict(unit) for unit in units]
-    print(json.dumps(payload, indent=2))
+    write_json_stdout(payload)
     return 0
 
 
@@ -0,0 +1,36 @@
+"""
+Data directory resolution for CAT-Pharmacy.
+Locates the shared JSON datastore used by the parser, session, lesson, and exam engines.
+"""
+
+from __future__ import annotations
+
+import functools
+import os
+from pathlib import Path
+from typing import Optional
+
+
+@functools.lru_cache(maxsize=1)
+def default_data_dir() -> Optional[Path]:
+    environ = os.environ
+    if "CAT_DATA_DIR" in environ:
+        return Path(environ["CAT_DATA_DIR"])
+
+    if "LOCALAPPDATA" in environ:
+        return Path(environ["LOCALAPPDATA"]) / "CatAdaptive" / "data"
+
+    home_dir = Path.home()
+    if home_dir.exists():
+        return home_dir / ".local" / "share" / "CatAdaptive" / "data"
+
+    return None
+
+
+@functools.lru_cache(maxsize=8)
+def resolve_data_dir(data_dir: Optional[Path]) -> Optional[Path]:
+    target_dir = data_dir or default_data_dir()
+    if target_dir is None:
+        return None
+    target_dir.mkdir(parents=True, exist_ok=True)
+    return target_dir
@@ -5,26 +5,49 @@ Handles mastery calculations, IRT-based student modeling, and session summary ge
 
 from __future__ import annotations
 
-import argparse
+import bisect
+import functools
 import json
 import math
 import os
 import sys
-from dataclasses import dataclass
+from collections import Counter
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from enum import Enum
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional
 from uuid import UUID, uuid4
 
-from backend.models import GraphSummary, write_json_atomic
+from backend.models import (
+    GraphSummary,
+    json_loads,
+    new_id,
+    read_json,
+    write_json_atomic,
+    write_json_atomic_batch,
+    write_json_stdout,
+)
+from backend.paths import default_data_dir
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover - optional speedup
+    np = None
+    HAS_NUMPY = False
 
 SESSION_STATE_FILE = "adaptive-session.json"
 KNOWLEDGE_UNITS_FILE = "knowledge-units.json"
 STUDENT_STATE_PREFIX = "student-state"
 
+_SESSION_STATE_CACHE: Dict[Path, tuple[tuple[int, int], dict]] = {}
+_TRANSIENT_ID = UUID(int=0)
+_TRANSIENT_TIMESTAMP = datetime(1970, 1, 1)
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class AbilityEstimate:
     id: UUID
     theta: float
@@ -44,10 +67,15 @@ class AbilityEstimate:
 
     @staticmethod
     def initial(theta: float = -1.5, standard_error: float = 1.0, method: str = "Prior") -> "AbilityEstimate":
-        return AbilityEstimate(uuid4(), theta, standard_error, method, datetime.utcnow())
+        return AbilityEstimate(new_id(), theta, standard_error, method, datetime.utcnow())
+
+    @staticmethod
+    def transient(theta: float, standard_error: float, method: str = "MLE") -> "AbilityEstimate":
+        """An estimate that is never stored, so it skips id generation and the clock read."""
+        return AbilityEstimate(_TRANSIENT_ID, theta, standard_error, method, _TRANSIENT_TIMESTAMP)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TerminationCriteria:
     target_standard_error: float
     max_items: int
@@ -59,7 +87,7 @@ class TerminationCriteria:
         return TerminationCriteria(0.3, 25, 1.2, 3)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class LearnerProfile:
     id: UUID
     name: str
@@ -71,7 +99,7 @@ class LearnerProfile:
             raise ValueError("Name is required")
 
         goals = [goal.strip() for goal in objectives or [] if goal and goal.strip()]
-        return LearnerProfile(uuid4(), name.strip(), goals)
+        return LearnerProfile(new_id(), name.strip(), goals)
 
 
 class ItemFormat(str, Enum):
@@ -81,7 +109,7 @@ class ItemFormat(str, Enum):
     MECHANISTIC_EXPLANATION = "MechanisticExplanation"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ItemChoice:
     id: UUID
     text: str
@@ -89,40 +117,89 @@ class ItemChoice:
 
     @staticmethod
     def create(text: str, is_correct: bool) -> "ItemChoice":
-        return ItemChoice(uuid4(), text, is_correct)
+        return ItemChoice(new_id(), text, is_correct)
+
 
+def _sigmoid(z: float) -> float:
+    # Only ever exponentiate a non-positive value, so neither tail can overflow.
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    exp_z = math.exp(z)
+    return exp_z / (1.0 + exp_z)
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class ItemParameter:
     difficulty: float
     discrimination: float = 1.0
     guessing: float = 0.2
+    # Derived once per (immutable) parameter set instead of on every evaluation.
+    _scaled_slope: float = field(init=False, repr=False, compare=False)
+    _scaled_slope_squared: float = field(init=False, repr=False, compare=False)
+    _one_minus_guessing: float = field(init=False, repr=False, compare=False)
 
     _D = 1.7
     _MAX_EXPONENT = 35.0
     _MIN_PROBABILITY = 1e-9
 
+    def __post_init__(self) -> None:
+        scaled_slope = self._D * self.discrimination
+        object.__setattr__(self, "_scaled_slope", scaled_slope)
+        object.__setattr__(self, "_scaled_slope_squared", scaled_slope**2)
+        object.__setattr__(self, "_one_minus_guessing", 1.0 - self.guessing)
+
     def probability_correct(self, theta: float) -> float:
-        exponent = -self._D * self.discrimination * (theta - self.difficulty)
-        capped = max(-self._MAX_EXPONENT, min(self._MAX_EXPONENT, exponent))
-        logistic = 1.0 / (1.0 + math.exp(capped))
-        return self.guessing + (1 - self.guessing) * logistic
+        logistic = _sigmoid(self._scaled_slope * (theta - self.difficulty))
+        return self.guessing + self._one_minus_guessing * logistic
 
     def fisher_information(self, theta: float) -> float:
-        p = self.probability_correct(theta)
-        q = 1.0 - p
-        one_minus_guessing = 1.0 - self.guessing
+        return self._information_at_probability(self.probability_correct(theta))
+
+    def _information_at_probability(self, p: float) -> float:
+        one_minus_guessing = self._one_minus_guessing
         if one_minus_guessing <= 0:
             return 0.0
 
         clamped_p = max(self._MIN_PROBABILITY, min(1.0 - self._MIN_PROBABILITY, p))
         clamped_q = 1.0 - clamped_p
-        scaled_slope = self._D * self.discrimination
         normalized_p = (clamped_p - self.guessing) / one_minus_guessing
-        return (scaled_slope**2) * (clamped_q / clamped_p) * (normalized_p**2)
+        return self._scaled_slope_squared * (clamped_q / clamped_p) * (normalized_p**2)
+
+
+def _item_parameter_arrays(items: Iterable["ItemTemplate"]) -> tuple:
+    parameters = [item.parameter for item in items]
+    count = len(parameters)
+    return (
+        np.fromiter((parameter.difficulty for parameter in parameters), dtype=np.float64, count=count),
+        np.fromiter((parameter.discrimination for parameter in parameters), dtype=np.float64, count=count),
+        np.fromiter((parameter.guessing for parameter in parameters), dtype=np.float64, count=count),
+    )
+
 
+def _fisher_information_array(difficulty, discrimination, guessing, theta: float):
+    """Vectorized ItemParameter.fisher_information over parallel parameter arrays."""
+    scaled_slope = ItemParameter._D * discrimination
+    max_exponent = ItemParameter._MAX_EXPONENT
+    exponent = np.clip(-scaled_slope * (theta - difficulty), -max_exponent, max_exponent)
+    one_minus_guessing = 1.0 - guessing
+    p = guessing + one_minus_guessing / (1.0 + np.exp(exponent))
+    clamped_p = np.clip(p, ItemParameter._MIN_PROBABILITY, 1.0 - ItemParameter._MIN_PROBABILITY)
+    valid = one_minus_guessing > 0
+    normalized_p = (clamped_p - guessing) / np.where(valid, one_minus_guessing, 1.0)
+    information = (scaled_slope**2) * ((1.0 - clamped_p) / clamped_p) * (normalized_p**2)
+    return np.where(valid, information, 0.0)
 
-@dataclass(frozen=True)
+
+def _fisher_information_2pl_array(difficulty, discrimination, guessing, theta: float):
+    """_fisher_information_array for pools without guessing, where (p - g) / (1 - g) is just p."""
+    scaled_slope = ItemParameter._D * discrimination
+    max_exponent = ItemParameter._MAX_EXPONENT
+    exponent = np.clip(-scaled_slope * (theta - difficulty), -max_exponent, max_exponent)
+    p = np.clip(1.0 / (1.0 + np.exp(exponent)), ItemParameter._MIN_PROBABILITY, 1.0 - ItemParameter._MIN_PROBABILITY)
+    return (scaled_slope**2) * p * (1.0 - p)
+
+
+@dataclass(frozen=True, slots=True)
 class ItemTemplate:
     id: UUID
     stem: str
@@ -164,7 +241,7 @@ class ItemTemplate:
         secondary_list = list(secondary_concept_ids or [])
 
         return ItemTemplate(
-            id=uuid4(),
+            id=new_id(),
             stem=stem.strip(),
             choices=choice_list,
             format=format,
@@ -180,7 +257,7 @@ class ItemTemplate:
         )
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ItemResponse:
     item_id: UUID
     item_template_id: UUID
@@ -230,12 +307,37 @@ class AdaptiveSession:
         self.id = id
         self.learner = learner
         self.criteria = criteria
+        # Criteria are frozen, so an absent mastery target becomes +inf once rather than a
+        # None check on every response.
+        self._mastery_theta = math.inf if criteria.mastery_theta is None else criteria.mastery_theta
         self.current_ability = initial_ability or AbilityEstimate.initial()
         self.active_item: Optional[ItemTemplate] = None
         self.is_complete = False
 
-        self._remaining_items = list(item_pool)
+        self._pool = tuple(item_pool)
         self._responses: List[ItemResponse] = []
+        # Items are never moved once pooled: selection clears a slot in the alive mask and the
+        # parameter arrays stay aligned with _pool for vectorized scoring.
+        self._remaining_count = len(self._pool)
+        # Theta often repeats between selections (it saturates at the +/-3 clamp), so the last
+        # information vector is kept and reused whenever theta is unchanged.
+        self._information_theta: Optional[float] = None
+        self._information = None
+        if HAS_NUMPY:
+            self._parameter_arrays = _item_parameter_arrays(self._pool)
+            self._alive = np.ones(len(self._pool), dtype=bool)
+            self._information_kernel = (
+                _fisher_information_2pl_array
+                if not self._parameter_arrays[2].any()
+                else _fisher_information_array
+            )
+        else:
+            self._parameter_arrays = None
+            self._alive = [True] * len(self._pool)
+            self._parameter_tuples = [
+                (item.parameter.difficulty, item.parameter.discrimination, item.parameter.guessing)
+                for item in self._pool
+            ]
 
     @property
     def responses(self) -> List[ItemResponse]:
@@ -246,18 +348,52 @@ class AdaptiveSession:
             self.active_item = None
             return None
 
-        if not self._remaining_items:
+        if not self._remaining_count:
             self.is_complete = True
             self.active_item = None
             return None
 
-        self.active_item = max(
-            self._remaining_items,
-            key=lambda item: item.parameter.fisher_information(self.current_ability.theta),
-        )
-        self._remaining_items.remove(self.active_item)
+        theta = self.current_ability.theta
+        if self._parameter_arrays is not None:
+            if theta != self._information_theta:
+                self._information = self._information_kernel(*self._parameter_arrays, theta)
+                self._information_theta = theta
+            index = int(np.where(self._alive, self._information, -np.inf).argmax())
+        else:
+            index = self._most_informative_index(theta)
+        self._alive[index] = False
+        self._remaining_count -= 1
+        self.active_item = self._pool[index]
         return self.active_item
 
+    def _most_informative_index(self, theta: float) -> int:
+        # Scalar twin of _fisher_information_array with ItemParameter.fisher_information inlined;
+        # the strict ">" keeps the first maximal item, matching max().
+        d = ItemParameter._D
+        min_p = ItemParameter._MIN_PROBABILITY
+        max_p = 1.0 - min_p
+        sigmoid = _sigmoid
+        best_index = -1
+        best_information = -math.inf
+        for position, (alive, (difficulty, discrimination, guessing)) in enumerate(
+            zip(self._alive, self._parameter_tuples)
+        ):
+            if not alive:
+                continue
+            one_minus_guessing = 1.0 - guessing
+            if one_minus_guessing <= 0:
+                information = 0.0
+            else:
+                scaled_slope = d * discrimination
+                p = guessing + one_minus_guessing * sigmoid(scaled_slope * (theta - difficulty))
+                clamped_p = max(min_p, min(max_p, p))
+                normalized_p = (clamped_p - guessing) / one_minus_guessing
+                information = (scaled_slope**2) * ((1.0 - clamped_p) / clamped_p) * (normalized_p**2)
+            if information > best_information:
+                best_index = position
+                best_information = information
+        return best_index
+
     def record_response(self, is_correct: bool, response_time: timedelta, raw_response: str) -> ItemResponse:
         if self.active_item is None:
             raise RuntimeError("Cannot record a response without an active item.")
@@ -267,7 +403,7 @@ class AdaptiveSession:
         self.current_ability = updated_ability
 
         response = ItemResponse.create(
-            uuid4(),
+            new_id(),
             self.active_item.id,
             is_correct,
             score,
@@ -288,36 +424,34 @@ class AdaptiveSession:
         theta = self.current_ability.theta
         probability = item.parameter.probability_correct(theta)
         score = 1.0 if is_correct else 0.0
-        info = max(item.parameter.fisher_information(theta), 1e-3)
+        info = max(item.parameter._information_at_probability(probability), 1e-3)
         gradient = score - probability
         step = gradient / info
 
         new_theta = max(-3.0, min(3.0, theta + step))
         standard_error = 1.0 / math.sqrt(info)
-        return AbilityEstimate(uuid4(), new_theta, standard_error, "MLE", datetime.utcnow())
+        return AbilityEstimate(new_id(), new_theta, standard_error, "MLE", datetime.utcnow())
 
     def _should_terminate(self) -> bool:
         if len(self._responses) >= self.criteria.max_items:
             return True
 
-        if self.current_ability.standard_error <= self.criteria.target_standard_error:
-            return True
-
-        if self.criteria.mastery_theta is not None and self.current_ability.theta >= self.criteria.mastery_theta:
-            return True
-
-        return False
+        ability = self.current_ability
+        return (
+            ability.standard_error <= self.criteria.target_standard_error
+            or ability.theta >= self._mastery_theta
+        )
 
 
 def build_graph_summary(graph_path: Optional[Path], student_state_path: Optional[Path]) -> GraphSummary:
     if graph_path is None or not graph_path.exists():
         return GraphSummary.empty()
 
-    data = json.loads(graph_path.read_text(encoding="utf-8"))
+    data = read_json(graph_path)
     student_state = None
     if student_state_path is not None and student_state_path.exists():
         try:
-            student_state = json.loads(student_state_path.read_text(encoding="utf-8"))
+            student_state = read_json(student_state_path)
         except json.JSONDecodeError:
             student_state = None
 
@@ -332,14 +466,14 @@ def build_graph_summary(graph_path: Optional[Path], student_state_path: Optional
 
 def resolve_graph_path(data_dir: Optional[Path]) -> Optional[Path]:
     if data_dir is None:
-        data_dir = _default_data_dir()
+        data_dir = default_data_dir()
 
-    if data_dir is None or not data_dir.exists():
+    if data_dir is None:
         return None
 
-    knowledge_graphs = sorted(data_dir.glob("knowledge-graph-*.json"), key=lambda p: p.stat().st_mtime)
-    if knowledge_graphs:
-        return knowledge_graphs[-1]
+    newest_graph = _newest_json_file(data_dir, "knowledge-graph-")
+    if newest_graph is not None:
+        return newest_graph
 
     domain_graph = data_dir / "domain-knowledge-graph.json"
     if domain_graph.exists():
@@ -350,30 +484,39 @@ def resolve_graph_path(data_dir: Optional[Path]) -> Optional[Path]:
 
 def resolve_student_state_path(data_dir: Optional[Path]) -> Optional[Path]:
     if data_dir is None:
-        data_dir = _default_data_dir()
+        data_dir = default_data_dir()
 
-    if data_dir is None or not data_dir.exists():
+    if data_dir is None:
         return None
 
-    states = sorted(data_dir.glob("student-state-*.json"), key=lambda p: p.stat().st_mtime)
-    if states:
-        return states[-1]
-
-    return None
+    return _newest_json_file(data_dir, f"{STUDENT_STATE_PREFIX}-")
 
 
-def _default_data_dir() -> Optional[Path]:
-    env_dir = Path(str(Path.home()))
-    if "CAT_DATA_DIR" in os.environ:
-        return Path(os.environ["CAT_DATA_DIR"])
-
-    if "LOCALAPPDATA" in os.environ:
-        return Path(os.environ["LOCALAPPDATA"]) / "CatAdaptive" / "data"
-
-    if env_dir.exists():
-        return env_dir / ".local" / "share" / "CatAdaptive" / "data"
+def _newest_json_file(data_dir: Path, prefix: str) -> Optional[Path]:
+    # One scandir pass, stat-ing only the matching entries; glob() would list the
+    # directory and then stat each match again through Path.stat().
+    try:
+        entries = os.scandir(data_dir)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
 
-    return None
+    newest_mtime = None
+    newest_path = None
+    with entries:
+        for entry in entries:
+            if not (entry.name.startswith(prefix) and entry.name.endswith(".json")):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                # Removed by a concurrent writer after the listing; the rest still count.
+                continue
+            if newest_mtime is None or mtime > newest_mtime:
+                newest_mtime = mtime
+                newest_path = entry.path
+    return Path(newest_path) if newest_path is not None else None
 
 
 def _summary_to_payload(summary: GraphSummary) -> dict:
@@ -381,26 +524,32 @@ def _summary_to_payload(summary: GraphSummary) -> dict:
 
 
 def _resolve_units_path(data_dir: Optional[Path]) -> Optional[Path]:
-    target_dir = data_dir or _default_data_dir()
+    target_dir = data_dir or default_data_dir()
     if target_dir is None:
         return None
-    if not target_dir.exists():
-        return None
-    units_path = target_dir / KNOWLEDGE_UNITS_FILE
-    if units_path.exists():
-        return units_path
-    return None
+    return target_dir / KNOWLEDGE_UNITS_FILE
 
 
-def _load_units(data_dir: Optional[Path]) -> List[dict]:
+def _load_unit_index(data_dir: Optional[Path]) -> tuple[List[dict], Mapping[str, dict]]:
     units_path = _resolve_units_path(data_dir)
     if units_path is None:
-        return []
+        return [], MappingProxyType({})
+    # A single stat both checks existence and keys the cache; a missing directory or file
+    # raises here instead of needing separate exists() probes.
+    try:
+        stat = units_path.stat()
+    except FileNotFoundError:
+        return [], MappingProxyType({})
+    units, units_by_id = _load_units_for_stat(str(units_path), stat.st_mtime_ns, stat.st_size)
+    return list(units), units_by_id
+
 
-    payload = json.loads(units_path.read_text(encoding="utf-8"))
+@functools.lru_cache(maxsize=4)
+def _load_units_for_stat(path_str: str, mtime_ns: int, size: int) -> tuple[tuple[dict, ...], Mapping[str, dict]]:
+    payload = read_json(Path(path_str))
     raw_units = payload.get("units") if isinstance(payload, dict) else payload
     if not isinstance(raw_units, list):
-        return []
+        return (), MappingProxyType({})
 
     normalized: List[dict] = []
     for index, raw in enumerate(raw_units):
@@ -421,43 +570,66 @@ def _load_units(data_dir: Optional[Path]) -> List[dict]:
             }
         )
 
-    return normalized
+    return tuple(normalized), MappingProxyType({unit["id"]: unit for unit in normalized})
 
 
 def _resolve_session_state_path(data_dir: Optional[Path]) -> Optional[Path]:
-    target_dir = data_dir or _default_data_dir()
+    target_dir = data_dir or default_data_dir()
     if target_dir is None:
         return None
-    if not target_dir.exists():
-        return None
     return target_dir / SESSION_STATE_FILE
 
 
 def _load_session_state(data_dir: Optional[Path]) -> Optional[dict]:
     state_path = _resolve_session_state_path(data_dir)
-    if state_path is None or not state_path.exists():
+    if state_path is None:
+        return None
+    try:
+        stat = state_path.stat()
+    except FileNotFoundError:
         return None
+    # The cached dict is handed over, not shared: it only returns to the cache once saved,
+    # so a caller that fails half-way through an update falls back to the file next time.
+    cached = _SESSION_STATE_CACHE.pop(state_path, None)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
     try:
-        return json.loads(state_path.read_text(encoding="utf-8"))
+        return read_json(state_path)
     except json.JSONDecodeError:
         return None
 
 
 def _save_session_state(data_dir: Optional[Path], state: dict) -> None:
-    target_dir = data_dir or _default_data_dir()
-    if target_dir is None:
+    state_path = _resolve_session_state_save_path(data_dir)
+    if state_path is None:
         return
+    write_json_atomic(state_path, state, indent=None)
+    _remember_session_state(state_path, state)
+
+
+def _remember_session_state(state_path: Path, state: dict) -> None:
+    try:
+        stat = state_path.stat()
+    except OSError:
+        return
+    _SESSION_STATE_CACHE[state_path] = ((stat.st_mtime_ns, stat.st_size), state)
+
+
+def _resolve_session_state_save_path(data_dir: Optional[Path]) -> Optional[Path]:
+    target_dir = data_dir or default_data_dir()
+    if target_dir is None:
+        return None
     target_dir.mkdir(parents=True, exist_ok=True)
-    state_path = target_dir / SESSION_STATE_FILE
-    write_json_atomic(state_path, state)
+    return target_dir / SESSION_STATE_FILE
 
 
 def _resolve_student_state_save_path(data_dir: Optional[Path]) -> Optional[Path]:
-    target_dir = data_dir or _default_data_dir()
+    target_dir = data_dir or default_data_dir()
     if target_dir is None:
         return None
     target_dir.mkdir(parents=True, exist_ok=True)
 
+    # Always the newest file, the same one resolve_student_state_path hands to readers.
     existing = resolve_student_state_path(target_dir)
     if existing is not None:
         return existing
@@ -466,14 +638,17 @@ def _resolve_student_state_save_path(data_dir: Optional[Path]) -> Optional[Path]
     return target_dir / f"{STUDENT_STATE_PREFIX}-{timestamp}.json"
 
 
-def _initialize_session(units: List[dict]) -> dict:
+@functools.lru_cache(maxsize=8)
+def _spread_difficulties(count: int) -> tuple[float, ...]:
+    if count <= 1:
+        return (0.0,) * count
+    return tuple((index / (count - 1)) * 2.0 - 1.0 for index in range(count))
+
+
+def _initialize_session(units: List[dict], created_at: str) -> dict:
     ability = AbilityEstimate.initial()
     unit_ids = [unit["id"] for unit in units]
-    count = len(unit_ids) or 1
-    unit_difficulties = {
-        unit_id: ((index / (count - 1)) * 2.0 - 1.0) if count > 1 else 0.0
-        for index, unit_id in enumerate(unit_ids)
-    }
+    unit_difficulties = dict(zip(unit_ids, _spread_difficulties(len(unit_ids))))
     mastery = {
         unit_id: {
             "score": 0.0,
@@ -488,45 +663,55 @@ def _initialize_session(units: List[dict]) -> dict:
     }
     return {
         "sessionId": str(uuid4()),
-        "createdAt": datetime.utcnow().isoformat() + "Z",
-        "updatedAt": datetime.utcnow().isoformat() + "Z",
+        "createdAt": created_at,
+        "updatedAt": created_at,
         "ability": {
             "theta": ability.theta,
             "standardError": ability.standard_error,
         },
-        "responses": [],
+        "responseCount": 0,
+        "recentResponses": [],
         "remainingUnitIds": unit_ids,
         "activeUnitId": None,
         "unitDifficulties": unit_difficulties,
         "mastery": mastery,
+        "masteryLevelCounts": _build_mastery_levels(mastery),
         "stallCount": 0,
     }
 
 
-def _update_ability_estimate(theta: float, item_parameter: ItemParameter, is_correct: bool) -> AbilityEstimate:
+@functools.lru_cache(maxsize=4096)
+def _unit_item_parameter(difficulty: float) -> ItemParameter:
+    # Units differ only in difficulty; discrimination and guessing keep the defaults.
+    return ItemParameter(difficulty=difficulty)
+
+
+@functools.lru_cache(maxsize=4096)
+def _item_statistics(item_parameter: ItemParameter, theta: float) -> tuple[float, float]:
     probability = item_parameter.probability_correct(theta)
+    return probability, item_parameter._information_at_probability(probability)
+
+
+def _update_ability_estimate(theta: float, item_parameter: ItemParameter, is_correct: bool) -> AbilityEstimate:
+    probability, info = _item_statistics(item_parameter, theta)
     score = 1.0 if is_correct else 0.0
-    info = max(item_parameter.fisher_information(theta), 1e-3)
+    info = max(info, 1e-3)
     gradient = score - probability
     step = gradient / info
 
     new_theta = max(-3.0, min(3.0, theta + step))
     standard_error = 1.0 / math.sqrt(info)
-    return AbilityEstimate(uuid4(), new_theta, standard_error, "MLE", datetime.utcnow())
+    return AbilityEstimate.transient(new_theta, standard_error)
+
+
+_LEVEL_THRESHOLDS = (0.2, 0.45, 0.65, 0.85)
+_LEVELS_BY_THRESHOLD = ("Unknown", "Novice", "Developing", "Proficient", "Advanced")
 
 
 def _normalize_level(score: float, attempts: int) -> str:
     if attempts <= 0:
         return "Unknown"
-    if score >= 0.85:
-        return "Advanced"
-    if score >= 0.65:
-        return "Proficient"
-    if score >= 0.45:
-        return "Developing"
-    if score >= 0.2:
-        return "Novice"
-    return "Unknown"
+    return _LEVELS_BY_THRESHOLD[bisect.bisect_right(_LEVEL_THRESHOLDS, score)]
 
 
 _SPACED_BASE_INTERVALS = {
@@ -539,21 +724,30 @@ _SPACED_BASE_INTERVALS = {
 
 _MAX_INTERVAL_DAYS = 60.0
 
+_RECENT_RESPONSE_LIMIT = 10
+
+_DEFAULT_ITEM_PARAMETER = ItemParameter(difficulty=0.0)
+_VECTORIZED_SELECTION_MIN_CANDIDATES = 8
+
 
 def _parse_assessed_timestamp(value: Optional[str]) -> datetime:
-    if not value:
-        return datetime.utcnow()
+    parsed = _parse_iso_timestamp(value) if value else None
+    return parsed if parsed is not None else datetime.utcnow()
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_iso_timestamp(value: str) -> Optional[datetime]:
     cleaned = value.replace("Z", "+00:00")
     try:
         parsed = datetime.fromisoformat(cleaned)
-        if parsed.tzinfo is None:
-            return parsed
-        return parsed.astimezone(timezone.utc).replace(tzinfo=None)
     except ValueError:
-        return datetime.utcnow()
+        return None
+    if parsed.tzinfo is None:
+        return parsed
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
 
 
-def _schedule_next_review(entry: dict, level: str, is_correct: bool, assessed_at: str) -> tuple[float, str]:
+def _schedule_next_review(entry: dict, level: str, is_correct: bool, assessed_dt: datetime) -> tuple[float, str]:
     base = _SPACED_BASE_INTERVALS.get(level, 1.0)
     previous_interval = entry.get("intervalDays")
     previous_value = None
@@ -568,18 +762,17 @@ def _schedule_next_review(entry: dict, level: str, is_correct: bool, assessed_at
         interval = max(base, previous_value * 1.8)
 
     interval = _clamp(interval, 0.25, _MAX_INTERVAL_DAYS)
-    assessed_dt = _parse_assessed_timestamp(assessed_at)
     next_review = assessed_dt + timedelta(days=interval)
     return interval, next_review.isoformat() + "Z"
 
 
-def _update_mastery_entry(entry: dict, is_correct: bool, assessed_at: str) -> dict:
+def _update_mastery_entry(entry: dict, is_correct: bool, assessed_at: str, assessed_dt: datetime) -> dict:
     attempts = int(entry.get("attempts") or 0) + 1
     correct = int(entry.get("correct") or 0) + (1 if is_correct else 0)
     score = float(entry.get("score") or 0.0)
     score = max(0.0, min(1.0, score + (0.2 if is_correct else -0.12)))
     level = _normalize_level(score, attempts)
-    interval_days, next_review_at = _schedule_next_review(entry, level, is_correct, assessed_at)
+    interval_days, next_review_at = _schedule_next_review(entry, level, is_correct, assessed_dt)
     return {
         "score": score,
         "level": level,
@@ -600,70 +793,91 @@ def _evaluate_response(unit: dict, payload: dict) -> bool:
         return False
 
     answer = raw_answer.lower()
-    key_points = unit.get("keyPoints") or []
-    for key_point in key_points:
-        if isinstance(key_point, str) and key_point.strip().lower() in answer:
-            return True
-    return False
+    return any(needle in answer for needle in _key_point_needles(tuple(unit.get("keyPoints") or ())))
+
+
+@functools.lru_cache(maxsize=1024)
+def _key_point_needles(key_points: tuple) -> tuple[str, ...]:
+    return tuple(key_point.strip().lower() for key_point in key_points if isinstance(key_point, str))
 
 
 def _select_next_unit(
-    units_by_id: Dict[str, dict],
-    remaining_unit_ids: List[str],
+    units_by_id: Mapping[str, dict],
+    remaining_unit_ids: Iterable[str],
     mastery: Dict[str, dict],
     unit_difficulties: Dict[str, float],
     theta: float,
+    now: datetime,
 ) -> Optional[dict]:
     if not remaining_unit_ids:
         return None
 
-    candidates: List[dict] = []
-    now = datetime.utcnow()
+    candidate_units: List[dict] = []
+    scores: List[float] = []
+    difficulties: List[float] = []
+    review_factors: List[float] = []
+    due_flags: List[int] = []
+    last_assessed_values: List[str] = []
     for unit_id in remaining_unit_ids:
         unit = units_by_id.get(unit_id)
         if unit is None:
             continue
         entry = mastery.get(unit_id, {})
-        score = float(entry.get("score") or 0.0)
-        last_assessed = entry.get("lastAssessed")
-        difficulty = float(unit_difficulties.get(unit_id, 0.0))
-        info = ItemParameter(difficulty=difficulty).fisher_information(theta)
-        priority = (1.0 - score) * (1.0 + info)
+        due = 0
+        review_factor = 1.0
         next_review_at = entry.get("nextReviewAt")
-        due = False
         if isinstance(next_review_at, str) and next_review_at.strip():
             review_dt = _parse_assessed_timestamp(next_review_at)
             if review_dt <= now:
-                due = True
-                priority *= 1.8
+                due = 1
+                review_factor = 1.8
             else:
-                priority *= 0.6
-        candidates.append(
-            {
-                "unit": unit,
-                "priority": priority,
-                "lastAssessed": last_assessed or "",
-                "due": 1 if due else 0,
-            }
-        )
-
-    if not candidates:
+                review_factor = 0.6
+        candidate_units.append(unit)
+        scores.append(float(entry.get("score") or 0.0))
+        difficulties.append(float(unit_difficulties.get(unit_id, 0.0)))
+        review_factors.append(review_factor)
+        due_flags.append(due)
+        last_assessed_values.append(entry.get("lastAssessed") or "")
+
+    if not candidate_units:
         return None
 
-    candidates.sort(key=lambda item: (item["due"], item["priority"], item["lastAssessed"]))
-    return candidates[-1]["unit"]
+    # Candidates rank by (due, priority, lastAssessed); ties resolve to the later candidate.
+    if HAS_NUMPY and len(candidate_units) >= _VECTORIZED_SELECTION_MIN_CANDIDATES:
+        count = len(candidate_units)
+        information = _fisher_information_array(
+            np.array(difficulties),
+            np.full(count, _DEFAULT_ITEM_PARAMETER.discrimination),
+            np.full(count, _DEFAULT_ITEM_PARAMETER.guessing),
+            theta,
+        )
+        priorities = (1.0 - np.array(scores)) * (1.0 + information) * np.array(review_factors)
+        order = np.lexsort((np.array(last_assessed_values), priorities, np.array(due_flags)))
+        return candidate_units[int(order[-1])]
+
+    priorities = [
+        (1.0 - score) * (1.0 + _item_statistics(_unit_item_parameter(difficulty), theta)[1]) * review_factor
+        for score, difficulty, review_factor in zip(scores, difficulties, review_factors)
+    ]
+    # max() keeps the first of equal keys, so scan backwards to keep the later candidate.
+    best_index = max(
+        reversed(range(len(candidate_units))),
+        key=lambda index: (due_flags[index], priorities[index], last_assessed_values[index]),
+    )
+    return candidate_units[best_index]
 
 
 def _inject_due_reviews(
-    units_by_id: Dict[str, dict],
-    remaining_unit_ids: List[str],
+    units_by_id: Mapping[str, dict],
+    remaining_unit_ids: Iterable[str],
     mastery: Dict[str, dict],
-) -> List[str]:
-    now = datetime.utcnow()
-    remaining = list(remaining_unit_ids or [])
-    remaining_set = set(remaining)
+    now: datetime,
+) -> Dict[str, None]:
+    # An insertion-ordered dict doubles as an ordered set: O(1) membership and removal.
+    remaining = dict.fromkeys(remaining_unit_ids or ())
     for unit_id, entry in mastery.items():
-        if unit_id in remaining_set:
+        if unit_id in remaining:
             continue
         if unit_id not in units_by_id:
             continue
@@ -672,19 +886,31 @@ def _inject_due_reviews(
             continue
         review_dt = _parse_assessed_timestamp(next_review_at)
         if review_dt <= now:
-            remaining.append(unit_id)
-            remaining_set.add(unit_id)
+            remaining[unit_id] = None
     return remaining
 
 
 def _build_mastery_levels(mastery: Dict[str, dict]) -> Dict[str, int]:
-    levels = {"Advanced": 0, "Proficient": 0, "Developing": 0, "Novice": 0, "Unknown": 0}
-    for entry in mastery.values():
-        level = entry.get("level") or "Unknown"
-        if level not in levels:
-            level = "Unknown"
-        levels[level] = levels.get(level, 0) + 1
-    return levels
+    levels = Counter(map(_mastery_level_bucket, mastery.values()))
+    return {level: levels[level] for level in reversed(_LEVELS_BY_THRESHOLD)}
+
+
+def _mastery_level_bucket(entry: Optional[dict]) -> str:
+    level = (entry.get("level") if entry else None) or "Unknown"
+    return level if level in _LEVELS_BY_THRESHOLD else "Unknown"
+
+
+def _load_mastery_level_counts(state: dict, mastery: Dict[str, dict]) -> Dict[str, int]:
+    # Trust the running histogram only while it still accounts for every mastery entry;
+    # older state files (or hand edits) fall back to a full recount.
+    counts = state.get("masteryLevelCounts")
+    if (
+        isinstance(counts, dict)
+        and all(isinstance(counts.get(level), int) for level in _LEVELS_BY_THRESHOLD)
+        and sum(counts[level] for level in _LEVELS_BY_THRESHOLD) == len(mastery)
+    ):
+        return {level: counts[level] for level in reversed(_LEVELS_BY_THRESHOLD)}
+    return _build_mastery_levels(mastery)
 
 
 def _clamp(value: float, low: float, high: float) -> float:
@@ -714,6 +940,27 @@ def _predict_correct_probability(mastery: Dict[str, dict]) -> float:
     return _clamp(average, 0.15, 0.9)
 
 
+def _simulate_horizon(
+    theta: float,
+    difficulty: float,
+    probability_correct: float,
+    horizon: int,
+) -> List[tuple[float, float]]:
+    """Expected (theta, standard error) after each of ``horizon`` simulated responses."""
+    # Both branches of a step share p and the information, hence the standard error; only
+    # the score in the gradient differs (see _update_ability_estimate).
+    item_parameter = _unit_item_parameter(difficulty)
+    trajectory: List[tuple[float, float]] = []
+    for _ in range(horizon):
+        probability, info = _item_statistics(item_parameter, theta)
+        info = max(info, 1e-3)
+        theta_if_correct = max(-3.0, min(3.0, theta + (1.0 - probability) / info))
+        theta_if_incorrect = max(-3.0, min(3.0, theta - probability / info))
+        theta = probability_correct * theta_if_correct + (1.0 - probability_correct) * theta_if_incorrect
+        trajectory.append((theta, 1.0 / math.sqrt(info)))
+    return trajectory
+
+
 def _build_predictive_plot(
     ability: Dict[str, float],
     mastery: Dict[str, dict],
@@ -729,25 +976,18 @@ def _build_predictive_plot(
     average_difficulty = _mean(difficulty_values, fallback=0.0)
     probability_correct = _predict_correct_probability(mastery)
 
-    points: List[dict] = []
-    theta = baseline_theta
-    current_se = baseline_se
-    for step in range(1, max(horizon, 1) + 1):
-        correct = _update_ability_estimate(theta, ItemParameter(difficulty=average_difficulty), True)
-        incorrect = _update_ability_estimate(theta, ItemParameter(difficulty=average_difficulty), False)
-        expected_theta = probability_correct * correct.theta + (1.0 - probability_correct) * incorrect.theta
-        expected_se = probability_correct * correct.standard_error + (1.0 - probability_correct) * incorrect.standard_error
-        points.append(
-            {
-                "step": step,
-                "expectedTheta": round(expected_theta, 3),
-                "expectedStandardError": round(expected_se, 3),
-                "lowerTheta": round(expected_theta - expected_se, 3),
-                "upperTheta": round(expected_theta + expected_se, 3),
-            }
-        )
-        theta = expected_theta
-        current_se = expected_se
+    trajectory = _simulate_horizon(baseline_theta, average_difficulty, probability_correct, max(horizon, 1))
+    points = [
+        {
+            "step": step,
+            "expectedTheta": round(expected_theta, 3),
+            "expectedStandardError": round(expected_se, 3),
+            "lowerTheta": round(expected_theta - expected_se, 3),
+            "upperTheta": round(expected_theta + expected_se, 3),
+        }
+        for step, (expected_theta, expected_se) in enumerate(trajectory, start=1)
+    ]
+    theta, current_se = trajectory[-1] if trajectory else (baseline_theta, baseline_se)
 
     return {
         "horizon": max(horizon, 1),
@@ -761,16 +1001,26 @@ def _build_predictive_plot(
     }
 
 
-def _save_student_state(
+def _save_response_state(
     data_dir: Optional[Path],
-    session_id: str,
+    state: dict,
     ability: dict,
     mastery: Dict[str, dict],
+    updated_at: str,
 ) -> None:
-    save_path = _resolve_student_state_save_path(data_dir)
-    if save_path is None:
-        return
-
+    writes = []
+    state_path = _resolve_session_state_save_path(data_dir)
+    if state_path is not None:
+        writes.append((state_path, state))
+    student_path = _resolve_student_state_save_path(data_dir)
+    if student_path is not None:
+        writes.append((student_path, _student_state_payload(state["sessionId"], ability, mastery, updated_at)))
+    write_json_atomic_batch(writes, indent=None)
+    if state_path is not None:
+        _remember_session_state(state_path, state)
+
+
+def _student_state_payload(session_id: str, ability: dict, mastery: Dict[str, dict], updated_at: str) -> dict:
     mastery_list: List[dict] = []
     for unit_id, entry in mastery.items():
         mastery_list.append(
@@ -786,44 +1036,54 @@ def _save_student_state(
             }
         )
 
-    payload = {
+    return {
         "sessionId": session_id,
-        "updatedAt": datetime.utcnow().isoformat() + "Z",
+        "updatedAt": updated_at,
         "ability": ability,
         "knowledgeMasteries": mastery_list,
     }
-    write_json_atomic(save_path, payload)
+
+
+def _load_response_history(state: dict) -> tuple[int, List[dict]]:
+    # Sessions saved before responseCount existed kept every response in "responses".
+    legacy = state.pop("responses", None)
+    if isinstance(legacy, list):
+        state["responseCount"] = len(legacy)
+        state["recentResponses"] = legacy[-_RECENT_RESPONSE_LIMIT:]
+    recent = state.get("recentResponses")
+    recent = list(recent) if isinstance(recent, list) else []
+    return int(state.get("responseCount") or 0), recent
 
 
 def process_response(payload: dict, data_dir: Optional[Path]) -> dict:
-    units = _load_units(data_dir)
+    units, units_by_id = _load_unit_index(data_dir)
     if not units:
         raise RuntimeError("No knowledge units available. Ingest content before starting a session.")
 
-    units_by_id = {unit["id"]: unit for unit in units}
-    state = _load_session_state(data_dir) or _initialize_session(units)
+    now = datetime.utcnow()
+    assessed_at = now.isoformat() + "Z"
+    state = _load_session_state(data_dir) or _initialize_session(units, assessed_at)
 
     mastery = state.get("mastery") or {}
-    remaining_unit_ids = list(state.get("remainingUnitIds") or [])
+    remaining_unit_ids = state.get("remainingUnitIds") or []
     unit_difficulties = state.get("unitDifficulties") or {}
-    responses = list(state.get("responses") or [])
+    response_count, recent_responses = _load_response_history(state)
     ability = state.get("ability") or {}
 
     action = payload.get("action") or "response"
-    assessed_at = datetime.utcnow().isoformat() + "Z"
 
     if payload.get("reset"):
-        state = _initialize_session(units)
+        state = _initialize_session(units, assessed_at)
         mastery = state["mastery"]
-        remaining_unit_ids = list(state["remainingUnitIds"])
+        remaining_unit_ids = state["remainingUnitIds"]
         unit_difficulties = state["unitDifficulties"]
-        responses = list(state["responses"])
+        response_count, recent_responses = _load_response_history(state)
         ability = state["ability"]
 
     if not remaining_unit_ids:
         remaining_unit_ids = [unit["id"] for unit in units]
 
-    remaining_unit_ids = _inject_due_reviews(units_by_id, remaining_unit_ids, mastery)
+    remaining_unit_ids = _inject_due_reviews(units_by_id, remaining_unit_ids, mastery, now)
 
     current_unit_id = payload.get("unitId") or state.get("activeUnitId")
     current_unit = units_by_id.get(str(current_unit_id)) if current_unit_id else None
@@ -835,6 +1095,7 @@ def process_response(payload: dict, data_dir: Optional[Path]) -> dict:
             mastery,
             unit_difficulties,
             float(ability.get("theta") or -1.5),
+            now,
         )
         state["activeUnitId"] = current_unit["id"] if current_unit else None
         state["updatedAt"] = assessed_at
@@ -843,12 +1104,12 @@ def process_response(payload: dict, data_dir: Optional[Path]) -> dict:
             "sessionId": state["sessionId"],
             "currentUnit": current_unit,
             "progress": {
-                "completed": len(responses),
+                "completed": response_count,
                 "total": len(units),
-                "percent": round((len(responses) / max(len(units), 1)) * 100, 1),
+                "percent": round((response_count / max(len(units), 1)) * 100, 1),
             },
             "ability": ability,
-            "masteryLevels": _build_mastery_levels(mastery),
+            "masteryLevels": _load_mastery_level_counts(state, mastery),
             "predictivePlot": _build_predictive_plot(ability, mastery, unit_difficulties),
             "isComplete": False if current_unit else True,
         }
@@ -856,14 +1117,15 @@ def process_response(payload: dict, data_dir: Optional[Path]) -> dict:
     is_correct = _evaluate_response(current_unit, payload)
     previous_theta = float(ability.get("theta") or -1.5)
     difficulty = float(unit_difficulties.get(current_unit["id"], 0.0))
-    updated_ability = _update_ability_estimate(previous_theta, ItemParameter(difficulty=difficulty), is_correct)
+    updated_ability = _update_ability_estimate(previous_theta, _unit_item_parameter(difficulty), is_correct)
 
     ability = {
         "theta": updated_ability.theta,
         "standardError": updated_ability.standard_error,
     }
 
-    responses.append(
+    response_count += 1
+    recent_responses.append(
         {
             "unitId": current_unit["id"],
             "isCorrect": is_correct,
@@ -872,18 +1134,24 @@ def process_response(payload: dict, data_dir: Optional[Path]) -> dict:
             "abilityAfter": ability,
         }
     )
+    del recent_responses[:-_RECENT_RESPONSE_LIMIT]
 
-    mastery_entry = mastery.get(current_unit["id"]) or {
+    mastery_levels = _load_mastery_level_counts(state, mastery)
+    previous_entry = mastery.get(current_unit["id"])
+    if previous_entry is not None:
+        mastery_levels[_mastery_level_bucket(previous_entry)] -= 1
+    mastery_entry = previous_entry or {
         "score": 0.0,
         "level": "Unknown",
         "attempts": 0,
         "correct": 0,
         "lastAssessed": None,
     }
-    mastery[current_unit["id"]] = _update_mastery_entry(mastery_entry, is_correct, assessed_at)
+    mastery[current_unit["id"]] = _update_mastery_entry(mastery_entry, is_correct, assessed_at, now)
+    mastery_levels[_mastery_level_bucket(mastery[current_unit["id"]])] += 1
 
-    if mastery[current_unit["id"]]["score"] >= 0.85 and current_unit["id"] in remaining_unit_ids:
-        remaining_unit_ids.remove(current_unit["id"])
+    if mastery[current_unit["id"]]["score"] >= 0.85:
+        remaining_unit_ids.pop(current_unit["id"], None)
 
     theta_shift = abs(updated_ability.theta - previous_theta)
     stall_count = int(state.get("stallCount") or 0)
@@ -894,7 +1162,7 @@ def process_response(payload: dict, data_dir: Optional[Path]) -> dict:
 
     criteria = TerminationCriteria.default()
     is_complete = False
-    if len(responses) >= criteria.max_items:
+    if response_count >= criteria.max_items:
         is_complete = True
     if updated_ability.standard_error <= criteria.target_standard_error:
         is_complete = True
@@ -913,22 +1181,24 @@ def process_response(payload: dict, data_dir: Optional[Path]) -> dict:
             mastery,
             unit_difficulties,
             updated_ability.theta,
+            now,
         )
 
     state.update(
         {
             "updatedAt": assessed_at,
             "ability": ability,
-            "responses": responses,
-            "remainingUnitIds": remaining_unit_ids,
+            "responseCount": response_count,
+            "recentResponses": recent_responses,
+            "remainingUnitIds": list(remaining_unit_ids),
             "activeUnitId": next_unit["id"] if next_unit else None,
             "mastery": mastery,
+            "masteryLevelCounts": mastery_levels,
             "stallCount": stall_count,
         }
     )
 
-    _save_session_state(data_dir, state)
-    _save_student_state(data_dir, state["sessionId"], ability, mastery)
+    _save_response_state(data_dir, state, ability, mastery, assessed_at)
 
     feedback = "Great job! Mastery is trending up." if is_correct else "Review the key points and try again."
     return {
@@ -940,22 +1210,30 @@ def process_response(payload: dict, data_dir: Optional[Path]) -> dict:
             "feedback": feedback,
         },
         "progress": {
-            "completed": len(responses),
+            "completed": response_count,
             "total": len(units),
-            "percent": round((len(responses) / max(len(units), 1)) * 100, 1),
+            "percent": round((response_count / max(len(units), 1)) * 100, 1),
         },
         "ability": ability,
-        "masteryLevels": _build_mastery_levels(mastery),
+        "masteryLevels": dict(mastery_levels),
         "predictivePlot": _build_predictive_plot(ability, mastery, unit_difficulties),
         "isComplete": is_complete,
     }
 
 
-def main() -> int:
+@functools.lru_cache(maxsize=1)
+def _build_arg_parser():
+    import argparse
+
     parser = argparse.ArgumentParser(description="Adaptive session utilities")
     parser.add_argument("--summary", action="store_true", help="Output knowledge graph summary as JSON")
     parser.add_argument("--process-response", action="store_true", help="Process a learning response as JSON")
     parser.add_argument("--data-dir", help="Override knowledge graph data directory")
+    return parser
+
+
+def main() -> int:
+    parser = _build_arg_parser()
     args = parser.parse_args()
 
     if args.summary:
@@ -963,15 +1241,15 @@ def main() -> int:
         graph_path = resolve_graph_path(data_dir)
         student_state_path = resolve_student_state_path(data_dir)
         summary = build_graph_summary(graph_path, student_state_path)
-        print(json.dumps(_summary_to_payload(summary)))
+        write_json_stdout(_summary_to_payload(summary))
         return 0
 
     if args.process_response:
         data_dir = Path(args.data_dir) if args.data_dir else None
-        raw = sys.stdin.read()
-        payload = json.loads(raw) if raw.strip() else {}
+        raw = sys.stdin.buffer.read()
+        payload = json_loads(raw) if raw.strip() else {}
         result = process_response(payload, data_dir)
-        print(json.dumps(result))
+        write_json_stdout(result)
         return 0
 
     parser.print_help()